@@ -0,0 +1,337 @@
+"""
+Columnar, memory-mapped store for the paragraphs behind the vector index.
+
+Row i describes vector id i:
+    chunk_doc.npy           int32   index into chunks.json "docs" (-1 = deleted row)
+    chunk_page.npy          int32   1-based page number
+    chunk_para.npy          int32   paragraph / chunk number within the document
+    chunk_heading.npy       int32   index into chunks.json "headings" (-1 = none); absent in format 1
+    chunk_text_offsets.npy  int64   row i's text is chunk_text.bin[offsets[i]:offsets[i+1]]
+    chunk_text.bin          utf-8 text of every row, back to back
+    chunk_vectors.bin       float16 (count, dim) normalised embeddings, when the store has them
+                            (dtype recorded in chunks.json; older stores hold float32)
+    bm25_*                  BM25 inverted index over the rows (see lexical_index)
+
+Convert an index that still has metadata.json with:
+    python -m backends.relevant_model.chunk_store <index_dir> [<index_dir> ...]
+"""
+import os
+import sys
+import json
+import logging
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from backends.relevant_model import lexical_index
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STORE_FILE = "chunks.json"
+TEXT_FILE = "chunk_text.bin"
+VECTORS_FILE = "chunk_vectors.bin"
+# half precision halves the side file; its error (~1e-3) is far below the gaps re-ranking decides on
+VECTOR_DTYPE = os.environ.get("RELEVANT_VECTOR_DTYPE", "float16")
+COLUMNS = ("doc", "page", "para", "heading")
+FORMAT_VERSION = 2
+
+
+def _column_path(store_dir, name):
+    return os.path.join(store_dir, f"chunk_{name}.npy")
+
+
+def exists(store_dir) -> bool:
+    return os.path.exists(os.path.join(store_dir, STORE_FILE))
+
+
+# -------------------------------
+# READER
+# -------------------------------
+class ChunkStore:
+    """
+    Read-only view over a chunk store. Columns stay on disk (mmapped),
+    so opening is O(1) and a lookup only touches the rows it reads.
+    """
+
+    def __init__(self, store_dir: str):
+        with open(os.path.join(store_dir, STORE_FILE), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        self.store_dir = store_dir
+        self.docs: List[str] = info["docs"]
+        self.count: int = info["count"]
+        self.doc = self._load(_column_path(store_dir, "doc"))
+        self.page = self._load(_column_path(store_dir, "page"))
+        self.para = self._load(_column_path(store_dir, "para"))
+        # format 1 stores predate section headings
+        self.headings: List[str] = info.get("headings", [])
+        heading_path = _column_path(store_dir, "heading")
+        self.heading_ids = self._load(heading_path) if os.path.exists(heading_path) else None
+        self.offsets = self._load(_column_path(store_dir, "text_offsets"))
+        text_path = os.path.join(store_dir, TEXT_FILE)
+        if os.path.getsize(text_path):
+            self._text = np.memmap(text_path, dtype=np.uint8, mode="r")
+        else:
+            self._text = np.zeros(0, dtype=np.uint8)
+        # embeddings side file: training / re-indexing / evaluation without re-encoding
+        self.dim = info.get("dim")
+        self.vectors = None
+        if self.dim and self.count:
+            self.vectors = np.memmap(os.path.join(store_dir, VECTORS_FILE), dtype=info["vector_dtype"],
+                                     mode="r", shape=(self.count, self.dim))
+        self._page_runs = None
+        self.lexical = lexical_index.open_index(store_dir)
+
+    def _load(self, path):
+        arr = np.load(path, mmap_mode="r")
+        return arr if arr.size else np.asarray(arr)
+
+    def __len__(self):
+        return self.count
+
+    def is_live(self, i: int) -> bool:
+        return 0 <= i < self.count and self.doc[i] >= 0
+
+    def live_ids(self) -> np.ndarray:
+        return np.flatnonzero(np.asarray(self.doc) >= 0)
+
+    def doc_id(self, i: int) -> str:
+        return self.docs[self.doc[i]]
+
+    def heading(self, i: int) -> Optional[str]:
+        if self.heading_ids is None or self.heading_ids[i] < 0:
+            return None
+        return self.headings[self.heading_ids[i]]
+
+    def text(self, i: int) -> str:
+        return bytes(self._text[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def texts(self, start: int, end: int) -> List[str]:
+        """Texts of rows [start, end) from a single read of the text blob."""
+        offsets = np.asarray(self.offsets[start:end + 1]) - self.offsets[start]
+        blob = bytes(self._text[self.offsets[start]:self.offsets[end]])
+        return [blob[a:b].decode("utf-8") for a, b in zip(offsets[:-1], offsets[1:])]
+
+    def page_runs(self) -> np.ndarray:
+        """
+        Row numbers where a new (doc, page) run starts, plus count at the end.
+        Rows of one page are contiguous, so run r spans [runs[r], runs[r + 1]).
+        Computed once per store.
+        """
+        if self._page_runs is None:
+            doc, page = np.asarray(self.doc), np.asarray(self.page)
+            breaks = np.flatnonzero((doc[1:] != doc[:-1]) | (page[1:] != page[:-1])) + 1
+            self._page_runs = np.concatenate(([0], breaks, [self.count])).astype("int64")
+        return self._page_runs
+
+    def page_bounds(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """[start, end) of the page run each of ids belongs to."""
+        runs = self.page_runs()
+        r = np.searchsorted(runs, ids, side="right") - 1
+        return runs[r], runs[r + 1]
+
+    def get(self, i: int) -> Optional[Dict]:
+        """Row i in the old metadata.json shape, or None for a deleted row."""
+        if not self.is_live(i):
+            return None
+        doc_id, page, para = self.doc_id(i), int(self.page[i]), int(self.para[i])
+        return {"doc_id": doc_id, "page": page, "text": self.text(i), "chunk_id": f"{doc_id}::p{page}::para{para}",
+                "heading": self.heading(i)}
+
+
+def open_store(store_dir) -> ChunkStore:
+    if not exists(store_dir):
+        if os.path.exists(os.path.join(store_dir, "metadata.json")):
+            # indexes built before the chunk store: convert once, in place
+            convert_metadata_json(store_dir)
+        else:
+            raise FileNotFoundError("Chunk store not found in " + store_dir)
+    return ChunkStore(store_dir)
+
+
+# -------------------------------
+# WRITER
+# -------------------------------
+class ChunkStoreWriter:
+    """
+    Appends rows to a new chunk store. Text goes straight to disk;
+    only the small integer columns are held until close().
+    """
+
+    def __init__(self, store_dir: str):
+        os.makedirs(store_dir, exist_ok=True)
+        self.store_dir = store_dir
+        self.docs: List[str] = []
+        self._doc_index: Dict[str, int] = {}
+        self.headings: List[str] = []
+        self._heading_index: Dict[str, int] = {}
+        self._columns = {name: array("i") for name in COLUMNS}
+        self._offsets = array("q", [0])
+        self._text = open(os.path.join(store_dir, TEXT_FILE), "wb")
+        self._vectors = open(os.path.join(store_dir, VECTORS_FILE), "wb")
+        self.lexical = lexical_index.LexicalIndexWriter(store_dir)
+        self.dim = None
+        self.vector_rows = 0
+        self._skip_vectors = False
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _doc(self, doc_id: str) -> int:
+        if doc_id not in self._doc_index:
+            self._doc_index[doc_id] = len(self.docs)
+            self.docs.append(doc_id)
+        return self._doc_index[doc_id]
+
+    def _heading(self, heading: Optional[str]) -> int:
+        if heading is None:
+            return -1
+        if heading not in self._heading_index:
+            self._heading_index[heading] = len(self.headings)
+            self.headings.append(heading)
+        return self._heading_index[heading]
+
+    def add(self, doc_id: str, page: int, para: int, text: str, heading: Optional[str] = None) -> int:
+        """Append one row and return its vector id."""
+        data = text.encode("utf-8")
+        self._text.write(data)
+        self._columns["doc"].append(self._doc(doc_id))
+        self._columns["page"].append(page)
+        self._columns["para"].append(para)
+        self._columns["heading"].append(self._heading(heading))
+        self._offsets.append(self._offsets[-1] + len(data))
+        self.lexical.add(len(self) - 1, text)
+        return len(self) - 1
+
+    def add_deleted(self) -> int:
+        """Append an empty tombstone row, keeping the vector id slot."""
+        self._columns["doc"].append(-1)
+        self._columns["page"].append(0)
+        self._columns["para"].append(0)
+        self._columns["heading"].append(-1)
+        self._offsets.append(self._offsets[-1])
+        return len(self) - 1
+
+    def extend(self, corpus: Iterable[Dict]):
+        for c in corpus:
+            self.add(c["doc_id"], c["page"], c["para"], c["text"], c.get("heading"))
+
+    def add_vectors(self, embeddings):
+        """Append embeddings for the next rows (in row order)."""
+        embeddings = np.ascontiguousarray(embeddings, dtype=VECTOR_DTYPE)
+        if self._skip_vectors or not len(embeddings):
+            return
+        self.dim = self.dim or embeddings.shape[1]
+        self._vectors.write(embeddings.tobytes())
+        self.vector_rows += len(embeddings)
+
+    def copy_from(self, store: ChunkStore, drop_docs: Iterable[str] = ()):
+        """
+        Carry every row of an existing store over, keeping vector ids.
+        Rows of drop_docs (and rows already deleted) become empty tombstones.
+        """
+        for doc_id in store.docs:
+            self._doc(doc_id)
+        if not len(store):
+            return
+        dropped = np.array([self._doc_index[d] for d in drop_docs if d in self._doc_index], dtype=np.int32)
+        doc = np.array(store.doc, dtype=np.int32)
+        doc[np.isin(doc, dropped)] = -1
+        live = doc >= 0
+
+        # copy the text of each run of live rows in a single write
+        offsets = np.asarray(store.offsets)
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], live, [False])).astype(np.int8)))
+        for start, end in zip(edges[::2], edges[1::2]):
+            self._text.write(bytes(store._text[offsets[start]:offsets[end]]))
+        lengths = np.diff(offsets) * live
+        base = self._offsets[-1]
+        self._offsets.extend((base + np.cumsum(lengths)).tolist())
+
+        self._columns["doc"].extend(doc.tolist())
+        self._columns["page"].extend(np.asarray(store.page).tolist())
+        self._columns["para"].extend(np.asarray(store.para).tolist())
+        if store.heading_ids is not None:
+            remap = np.array([self._heading(h) for h in store.headings] + [-1], dtype=np.int32)
+            self._columns["heading"].extend(np.where(live, remap[np.asarray(store.heading_ids)], -1).tolist())
+        else:
+            self._columns["heading"].extend([-1] * len(store))
+
+        if store.lexical is not None:
+            self.lexical.copy_from(store.lexical, live)
+        else:
+            # store from before the BM25 index: tokenise its live rows once
+            for i in np.flatnonzero(live):
+                self.lexical.add(int(i), store.text(int(i)))
+
+        if store.vectors is not None:
+            for start in range(0, len(store), 65536):
+                self.add_vectors(store.vectors[start:start + 65536])
+        else:
+            # rows without vectors can't be mixed with rows that have them; a rebuild restores the side file
+            self._skip_vectors = True
+
+    def abort(self):
+        """Close the open files without writing anything else; for a build that failed."""
+        self._text.close()
+        self._vectors.close()
+
+    def close(self):
+        """Flush every column; chunks.json is written last so a partial store is never readable."""
+        self._text.close()
+        self._vectors.close()
+        if self.vector_rows and self.vector_rows != len(self):
+            raise ValueError(f"Chunk store has {len(self)} rows but {self.vector_rows} vectors")
+        for name in COLUMNS:
+            np.save(_column_path(self.store_dir, name), np.frombuffer(self._columns[name], dtype=np.int32))
+        np.save(_column_path(self.store_dir, "text_offsets"), np.frombuffer(self._offsets, dtype=np.int64))
+        self.lexical.close(len(self))
+        info = {"format": FORMAT_VERSION, "count": len(self), "docs": self.docs, "headings": self.headings}
+        if self.vector_rows:
+            info.update(dim=self.dim, vector_dtype=VECTOR_DTYPE)
+        with open(os.path.join(self.store_dir, STORE_FILE), "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False)
+
+
+# -------------------------------
+# CONVERSION FROM metadata.json
+# -------------------------------
+def convert_metadata_json(index_dir, remove_json=False) -> int:
+    """
+    One-shot conversion of metadata.json (list indexed by vector id, None for
+    deleted rows) into a chunk store in the same directory. Returns the row count.
+    """
+    meta_path = os.path.join(index_dir, "metadata.json")
+    with open(meta_path, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+
+    writer = ChunkStoreWriter(index_dir)
+    for meta in metadata:
+        if meta is None:
+            writer.add_deleted()
+            continue
+        para = int(meta["chunk_id"].split("para")[-1])
+        writer.add(meta["doc_id"], meta["page"], para, meta["text"])
+
+    # old indexes were plain IndexFlatIP in row order, so the vectors can be read back out
+    idx_path = os.path.join(index_dir, "faiss_index.bin")
+    if os.path.exists(idx_path):
+        import faiss
+        index = faiss.read_index(idx_path)
+        if isinstance(index, faiss.IndexFlat) and index.ntotal == len(metadata):
+            writer.add_vectors(index.reconstruct_n(0, index.ntotal))
+    writer.close()
+
+    if remove_json:
+        os.remove(meta_path)
+    logger.info(f"Converted {len(metadata)} metadata rows in {index_dir} to a chunk store")
+    return len(metadata)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python -m backends.relevant_model.chunk_store <index_dir> [<index_dir> ...]")
+        sys.exit(1)
+    for d in sys.argv[1:]:
+        convert_metadata_json(d)
@@ -0,0 +1,148 @@
+"""
+Layout-aware chunking for the search index.
+
+Text comes from PyMuPDF blocks via EnhancedPDFExtractor (the outline
+extractor): repeated headers/footers are dropped, multi-line blocks merged
+and heading candidates become section boundaries. Blocks are then packed
+into chunks of at most CHUNK_TOKENS encoder tokens, never across a page or
+section boundary, with CHUNK_OVERLAP tokens of trailing context carried into
+the next chunk of the same section. Each chunk records its section heading.
+
+The "paragraph" chunker (extract_paragraphs_from_pages) lives here too: this
+module doesn't import the encoder, so extraction workers stay light.
+"""
+import os
+import re
+import logging
+from typing import List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from services.enhanced_extractor import EnhancedPDFExtractor
+
+logger = logging.getLogger(__name__)
+
+CHUNK_TOKENS = int(os.environ.get("RELEVANT_CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP = int(os.environ.get("RELEVANT_CHUNK_OVERLAP", "32"))
+# chunks shorter than this (stray page numbers, lone labels) are not worth an index slot
+MIN_CHUNK_TOKENS = int(os.environ.get("RELEVANT_CHUNK_MIN_TOKENS", "4"))
+
+_WORD = re.compile(r"\S+")
+
+# (page_number, section heading, text, is_heading)
+Unit = Tuple[int, Optional[str], str, bool]
+# (page_number, section heading, text)
+Chunk = Tuple[int, Optional[str], str]
+
+
+def layout_units(pdf_path: str) -> List[Unit]:
+    """Text blocks of a PDF in reading order, with the section heading each falls under."""
+    extractor = EnhancedPDFExtractor(detect_tables=False)
+    with fitz.open(pdf_path) as doc:
+        pages_lines = extractor.collect_lines(doc)
+        page_sizes = {i: (p.rect.width, p.rect.height) for i, p in enumerate(doc)}
+    drop = extractor.detect_repeated_headers_footers(pages_lines, page_sizes)
+    filtered = [[ln for j, ln in enumerate(lines) if (i, j) not in drop] for i, lines in enumerate(pages_lines)]
+    merged = extractor.merge_multiline_headings(filtered)
+    headings = {id(line) for line in extractor.pick_candidates(merged)}
+
+    units: List[Unit] = []
+    heading = None
+    for lines in merged:
+        for line in lines:
+            is_heading = id(line) in headings
+            if is_heading:
+                heading = line.text
+            units.append((line.page_idx + 1, heading, line.text, is_heading))
+    return units
+
+
+def extract_paragraphs_from_pages(pdf_path, first_page=0, last_page=None):
+    """
+    Return list of (page_number, paragraph_text) pairs for pages [first_page, last_page) of a PDF.
+    """
+    doc = fitz.open(pdf_path)
+    paragraphs = []
+    for i in range(first_page, doc.page_count if last_page is None else min(last_page, doc.page_count)):
+        page = doc.load_page(i)
+        text = page.get_text("text")
+        paras = [p.strip() for p in text.split("\n\n") if p.strip()]
+        for p in paras:
+            paragraphs.append((i + 1, p))
+    doc.close()
+    return paragraphs
+
+
+class Tokens:
+    """
+    Token counts and token-aligned splits from the encoder's own (fast) tokenizer;
+    whitespace words stand in when no fast tokenizer is available.
+    """
+
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer if getattr(tokenizer, "is_fast", False) else None
+
+    def spans(self, texts: List[str]) -> List[List[Tuple[int, int]]]:
+        """(start, end) character span of every token of every text."""
+        if self.tokenizer is None:
+            return [[m.span() for m in _WORD.finditer(t)] for t in texts]
+        enc = self.tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True)
+        return [[tuple(span) for span in offsets] for offsets in enc["offset_mapping"]]
+
+    def windows(self, text: str, spans: List[Tuple[int, int]], size: int, overlap: int) -> List[str]:
+        """Split text into pieces of at most size tokens, consecutive pieces sharing overlap tokens."""
+        step = max(1, size - overlap)
+        pieces = []
+        for start in range(0, len(spans), step):
+            end = min(start + size, len(spans))
+            pieces.append(text[spans[start][0]:spans[end - 1][1]])
+            if end == len(spans):
+                break
+        return pieces
+
+
+def pack(units: List[Unit], tokens: Tokens, max_tokens: int = CHUNK_TOKENS,
+         overlap: int = CHUNK_OVERLAP, min_tokens: int = MIN_CHUNK_TOKENS) -> List[Chunk]:
+    """Greedily pack units into token-bounded chunks; see the module docstring."""
+    counts = [len(s) for s in tokens.spans([u[2] for u in units])] if units else []
+    chunks: List[Chunk] = []
+    current: List[Tuple[str, int]] = []
+    size = 0
+    page, heading = None, None
+
+    def flush():
+        if current and size >= min_tokens:
+            chunks.append((page, heading, "\n".join(text for text, _ in current)))
+
+    for (u_page, u_heading, text, _), n in zip(units, counts):
+        if current and (u_page != page or u_heading != heading):
+            flush()
+            current, size = [], 0
+        page, heading = u_page, u_heading
+
+        if n > max_tokens:
+            flush()
+            current, size = [], 0
+            spans = tokens.spans([text])[0]
+            chunks.extend((page, heading, piece) for piece in tokens.windows(text, spans, max_tokens, overlap))
+            continue
+
+        if size + n > max_tokens:
+            flush()
+            # carry the trailing units that fit in the overlap budget (and leave room for this one)
+            budget = min(overlap, max_tokens - n)
+            carry, carried = [], 0
+            for unit in reversed(current):
+                if carried + unit[1] > budget:
+                    break
+                carry.insert(0, unit)
+                carried += unit[1]
+            current, size = carry, carried
+        current.append((text, n))
+        size += n
+    flush()
+    return chunks
+
+
+def chunk_pdf(pdf_path: str, tokens: Optional[Tokens] = None, **kwargs) -> List[Chunk]:
+    return pack(layout_units(pdf_path), tokens or Tokens(), **kwargs)
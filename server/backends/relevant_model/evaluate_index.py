@@ -0,0 +1,120 @@
+"""
+Recall vs latency and size of every index mode, measured against the exact
+Flat baseline on the vectors of the currently published index. Quantised
+modes are also measured with the exact re-rank search applies to them:
+
+    python -m backends.relevant_model.evaluate_index --queries 200 --k 10
+"""
+import argparse
+import time
+import logging
+
+import faiss
+import numpy as np
+
+from backends.relevant_model import index_factory, index_store, chunk_store
+
+logger = logging.getLogger(__name__)
+
+SWEEPS = {
+    "flat": [{}],
+    "sq8": [{}, {"rerank": 50}],
+    "ivf_flat": [{"nprobe": p} for p in (1, 4, 16, 64)],
+    "ivf_sq8": [{"nprobe": p} for p in (1, 4, 16, 64)] + [{"nprobe": 16, "rerank": 50}],
+    "ivf_pq": [{"nprobe": p} for p in (1, 4, 16, 64)] + [{"nprobe": 16, "rerank": 50}],
+    "hnsw": [{"ef_search": e} for e in (16, 64, 256)],
+}
+
+
+def load_corpus_vectors(index_dir):
+    version_dir = index_store.current_dir(index_dir)
+    if version_dir is None:
+        raise FileNotFoundError("No published index in " + index_dir)
+    store = chunk_store.open_store(version_dir)
+    if store.vectors is None:
+        raise ValueError("Index has no stored vectors; run POST /relevant/rebuild first")
+    ids = store.live_ids()
+    return np.ascontiguousarray(store.vectors[ids], dtype="float32"), ids
+
+
+def recall_at_k(found, truth):
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def time_search(index, queries, k, rerank=0, vectors=None):
+    """
+    Average per-query latency of one-at-a-time searches, like the /search endpoint.
+    With rerank, rerank candidates are re-scored exactly from vectors (indexed by id).
+    """
+    found = np.empty((len(queries), k), dtype="int64")
+    start = time.perf_counter()
+    for i, q in enumerate(queries):
+        if rerank:
+            ids = index.search(q[None, :], max(k, rerank))[1]
+            found[i] = index_factory.rerank(q[None, :], ids, vectors, k)[1][0]
+        else:
+            found[i] = index.search(q[None, :], k)[1][0]
+    return found, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def evaluate(vectors, modes, n_queries=200, k=10, seed=0):
+    """Return one row per (mode, search setting) with recall@k, latency and index size."""
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)]
+    k = min(k, len(vectors))
+    ids = np.arange(len(vectors), dtype="int64")  # row numbers, so re-ranking can index vectors directly
+
+    baseline = index_factory.build_index(vectors, ids, mode="flat")
+    truth, _ = time_search(baseline, queries, k)
+
+    rows = []
+    for mode in modes:
+        start = time.perf_counter()
+        try:
+            index = index_factory.build_index(vectors, ids, mode=mode)
+        except (RuntimeError, ValueError) as e:
+            rows.append({"mode": mode, "setting": "-", "error": str(e).splitlines()[0]})
+            continue
+        build_s = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 2**20
+        for params in SWEEPS[mode]:
+            params = dict(params)
+            rerank = params.pop("rerank", 0)
+            index_factory.configure_search(index, **params)
+            found, latency_ms = time_search(index, queries, k, rerank, vectors)
+            setting = dict(params, rerank=rerank) if rerank else params
+            rows.append({
+                "mode": mode,
+                "setting": ",".join(f"{key}={val}" for key, val in setting.items()) or "exact",
+                "recall": recall_at_k(found, truth),
+                "latency_ms": latency_ms,
+                "build_s": build_s,
+                "size_mb": size_mb,
+            })
+    return rows
+
+
+def main():
+    from services.relevant_service import INDEX_DIR
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--modes", default=",".join(index_factory.MODES))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors, _ = load_corpus_vectors(args.index_dir)
+    print(f"{len(vectors)} vectors, dim {vectors.shape[1]}, {min(args.queries, len(vectors))} queries, k={args.k}")
+    print(f"{'mode':<10} {'setting':<20} {'recall@k':>9} {'ms/query':>9} {'build s':>8} {'MB':>8}")
+    for row in evaluate(vectors, args.modes.split(","), args.queries, args.k):
+        if "error" in row:
+            print(f"{row['mode']:<10} {'skipped':<20} {row['error']}")
+            continue
+        print(f"{row['mode']:<10} {row['setting']:<20} {row['recall']:>9.3f} {row['latency_ms']:>9.3f} "
+              f"{row['build_s']:>8.2f} {row['size_mb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
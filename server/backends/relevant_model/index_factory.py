@@ -0,0 +1,180 @@
+import os
+import math
+import logging
+import numpy as np
+import faiss
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MODES = ("flat", "sq8", "ivf_flat", "ivf_sq8", "ivf_pq", "hnsw")
+# modes whose stored codes only approximate the vectors; search re-ranks their candidates exactly
+QUANTIZED_MODES = ("sq8", "ivf_sq8", "ivf_pq")
+
+# Deployment settings. RELEVANT_INDEX_MODE is one of MODES or "auto".
+INDEX_MODE = os.environ.get("RELEVANT_INDEX_MODE", "auto")
+NPROBE = int(os.environ.get("RELEVANT_NPROBE", "16"))
+EF_SEARCH = int(os.environ.get("RELEVANT_EF_SEARCH", "64"))
+HNSW_M = int(os.environ.get("RELEVANT_HNSW_M", "32"))
+PQ_M = int(os.environ.get("RELEVANT_PQ_M", "48"))  # sub-quantizers, must divide the embedding dim
+# int8 ranges are trained per dimension; widen them so vectors added later are not clipped
+SQ_RANGE_MARGIN = float(os.environ.get("RELEVANT_SQ_RANGE_MARGIN", "0.2"))
+
+# auto mode: exact search while it is cheap, int8 codes once the vectors take real memory,
+# IVF once brute force hurts, PQ when memory does
+AUTO_EXACT_MAX = 2_000
+AUTO_FLAT_MAX = 20_000
+AUTO_IVF_FLAT_MAX = 500_000
+TRAIN_POINTS_PER_LIST = 50
+
+
+def choose_mode(n_vectors, mode=None):
+    """Resolve "auto" (or None -> RELEVANT_INDEX_MODE) into a concrete mode for n_vectors."""
+    mode = mode or INDEX_MODE
+    if mode != "auto":
+        if mode not in MODES:
+            raise ValueError(f"Unknown index mode '{mode}', expected one of {MODES + ('auto',)}")
+        return mode
+    if n_vectors <= AUTO_EXACT_MAX:
+        return "flat"
+    if n_vectors <= AUTO_FLAT_MAX:
+        return "sq8"
+    if n_vectors <= AUTO_IVF_FLAT_MAX:
+        return "ivf_sq8"
+    return "ivf_pq"
+
+
+def _nlist(n_vectors):
+    # ~4*sqrt(n) lists, but never more than the data can train
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39 or 1))
+
+
+def factory_string(mode, n_vectors, dim):
+    if mode == "flat":
+        return "IDMap2,Flat"
+    if mode == "sq8":
+        return "IDMap2,SQ8"
+    if mode == "ivf_flat":
+        return f"IDMap2,IVF{_nlist(n_vectors)},Flat"
+    if mode == "ivf_sq8":
+        return f"IDMap2,IVF{_nlist(n_vectors)},SQ8"
+    if mode == "ivf_pq":
+        m = PQ_M if dim % PQ_M == 0 else dim // 16
+        return f"IDMap2,IVF{_nlist(n_vectors)},PQ{m}"
+    if mode == "hnsw":
+        return f"IDMap2,HNSW{HNSW_M}"
+    raise ValueError(f"Unknown index mode '{mode}'")
+
+
+def _train_sample(vectors, n_lists, seed=0):
+    n = len(vectors)
+    size = min(n, max(n_lists * TRAIN_POINTS_PER_LIST, 10_000))
+    if size >= n:
+        return np.ascontiguousarray(vectors, dtype="float32")
+    rows = np.sort(np.random.default_rng(seed).choice(n, size=size, replace=False))
+    return np.ascontiguousarray(vectors[rows], dtype="float32")
+
+
+def new_index(dim, n_vectors, mode=None, train_vectors=None):
+    """
+    Empty inner-product index addressed by explicit vector ids (IDMap2 wrapper),
+    trained on a sample of train_vectors when the mode needs it.
+    """
+    mode = choose_mode(n_vectors, mode)
+    index = faiss.index_factory(dim, factory_string(mode, n_vectors, dim), faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        if train_vectors is None or not len(train_vectors):
+            raise ValueError(f"Index mode '{mode}' needs training vectors")
+        inner = _inner(index)
+        if hasattr(inner, "sq"):
+            inner.sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+            inner.sq.rangestat_arg = SQ_RANGE_MARGIN
+        sample = _train_sample(train_vectors, inner.nlist if isinstance(inner, faiss.IndexIVF) else 0)
+        logger.info(f"Training {mode} index on {len(sample)} vectors")
+        index.train(sample)
+    configure_search(index)
+    logger.info(f"Created {mode} index for {n_vectors} vectors")
+    return index
+
+
+def build_index(vectors, ids=None, mode=None, batch_size=65536):
+    """Build an index over vectors (ids default to row numbers), adding in batches."""
+    vectors = np.asarray(vectors)
+    n, dim = vectors.shape
+    index = new_index(dim, n, mode, train_vectors=vectors)
+    if ids is None:
+        ids = np.arange(n, dtype="int64")
+    for start in range(0, n, batch_size):
+        chunk = np.ascontiguousarray(vectors[start:start + batch_size], dtype="float32")
+        index.add_with_ids(chunk, np.asarray(ids[start:start + batch_size], dtype="int64"))
+    return index
+
+
+def _inner(index):
+    return faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+
+
+def index_mode(index):
+    """Best-effort name of the mode an index was built with."""
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVFScalarQuantizer):
+        return "ivf_sq8"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(inner, faiss.IndexScalarQuantizer):
+        return "sq8"
+    return "flat"
+
+
+def is_quantized(index):
+    return index_mode(index) in QUANTIZED_MODES
+
+
+def rerank(queries, ids, vectors, k):
+    """
+    Exact inner products for candidate ids (one row per query, -1 = no hit) from
+    vectors, where vectors[i] is the vector of id i (e.g. the chunk store's mmapped
+    side file). Returns the top-k (scores, ids) per query, best first, -1 padded.
+    """
+    queries = np.asarray(queries, dtype="float32")
+    ids = np.asarray(ids, dtype="int64")
+    valid = (ids >= 0) & (ids < len(vectors))
+    # one sorted gather keeps mmap reads sequential and fetches shared candidates once
+    rows, inverse = np.unique(np.where(valid, ids, 0), return_inverse=True)
+    candidates = np.asarray(vectors[rows], dtype="float32")[inverse.reshape(ids.shape)]
+    scores = np.einsum("qnd,qd->qn", candidates, queries)
+    scores[~valid] = -np.inf
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    top_scores = np.take_along_axis(scores, order, axis=1)
+    top_ids = np.where(np.isfinite(top_scores), np.take_along_axis(ids, order, axis=1), -1)
+    return top_scores, top_ids
+
+
+def configure_search(index, nprobe=None, ef_search=None):
+    """
+    Apply query-time knobs: nprobe for IVF modes, efSearch for HNSW.
+    Done once per loaded index, so concurrent searches never race on it.
+    """
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = min(nprobe or NPROBE, inner.nlist)
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search or EF_SEARCH
+    return index
+
+
+def supports_remove(index):
+    return index_mode(index) != "hnsw"
+
+
+def rebuild_hint(index):
+    """Log when the corpus has outgrown (or shrunk below) the mode the index was built with."""
+    wanted = choose_mode(index.ntotal)
+    current = index_mode(index)
+    if INDEX_MODE == "auto" and wanted != current:
+        logger.info(f"Index holds {index.ntotal} vectors as {current}; auto mode would pick {wanted}. "
+                    f"Run POST /relevant/rebuild to switch.")
@@ -0,0 +1,147 @@
+import os
+import shutil
+import threading
+import logging
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+from backends.relevant_model import relevant_utilis, chunk_store, index_factory
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+POINTER_FILE = "CURRENT"
+VERSION_PREFIX = "v"
+# older versions kept around so a reader that just resolved the pointer can still open its files
+KEEP_VERSIONS = 3
+
+
+# -------------------------------
+# VERSIONED DIRECTORIES
+# -------------------------------
+def _version_number(name):
+    try:
+        return int(name[len(VERSION_PREFIX):]) if name.startswith(VERSION_PREFIX) else -1
+    except ValueError:
+        return -1
+
+
+def list_versions(index_dir) -> List[str]:
+    if not os.path.isdir(index_dir):
+        return []
+    names = [n for n in os.listdir(index_dir) if _version_number(n) >= 0 and os.path.isdir(os.path.join(index_dir, n))]
+    return sorted(names, key=_version_number)
+
+
+def current_version(index_dir) -> Optional[str]:
+    """
+    Name of the published version, "" for a legacy un-versioned index, None if there is no index.
+    """
+    pointer = os.path.join(index_dir, POINTER_FILE)
+    if os.path.exists(pointer):
+        with open(pointer, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    if os.path.exists(os.path.join(index_dir, "faiss_index.bin")):
+        return ""
+    return None
+
+
+def current_dir(index_dir) -> Optional[str]:
+    version = current_version(index_dir)
+    return None if version is None else os.path.join(index_dir, version)
+
+
+def prepare_version(index_dir):
+    """
+    Create the directory for the next version and return (version, path).
+    Nothing reads it until publish_version() points CURRENT at it.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    versions = list_versions(index_dir)
+    number = _version_number(versions[-1]) + 1 if versions else 1
+    version = f"{VERSION_PREFIX}{number:06d}"
+    path = os.path.join(index_dir, version)
+    os.makedirs(path)
+    return version, path
+
+
+def publish_version(index_dir, version):
+    """
+    Flip the pointer to a fully written version with an atomic rename.
+    Readers either see the old version or the new one, never a half-written index.
+    """
+    pointer = os.path.join(index_dir, POINTER_FILE)
+    with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer + ".tmp", pointer)
+    logger.info(f"Published index version {version}")
+
+    for old in list_versions(index_dir)[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(index_dir, old), ignore_errors=True)
+
+
+# -------------------------------
+# IN-MEMORY HOLDER
+# -------------------------------
+@dataclass
+class IndexSnapshot:
+    version: str
+    index: Any
+    store: chunk_store.ChunkStore
+
+
+class IndexHolder:
+    """
+    Keeps the published index in memory and swaps it when the pointer file changes.
+    Callers take a snapshot reference and use it for the whole search, so a swap
+    never affects an in-flight query and searches never wait for a reload.
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self._snapshot: Optional[IndexSnapshot] = None
+        self._pointer_stamp = None
+        self._reload_lock = threading.Lock()
+
+    def _stamp(self):
+        pointer = os.path.join(self.index_dir, POINTER_FILE)
+        try:
+            st = os.stat(pointer)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            legacy = os.path.join(self.index_dir, "faiss_index.bin")
+            return ("legacy", os.path.getmtime(legacy)) if os.path.exists(legacy) else None
+
+    def refresh(self, blocking: bool = True) -> Optional[IndexSnapshot]:
+        """Load the published version if it differs from the one held."""
+        if not self._reload_lock.acquire(blocking=blocking):
+            return self._snapshot
+        try:
+            stamp = self._stamp()
+            if stamp is None:
+                self._snapshot, self._pointer_stamp = None, None
+                return None
+            if stamp == self._pointer_stamp and self._snapshot is not None:
+                return self._snapshot
+            version = current_version(self.index_dir)
+            version_dir = os.path.join(self.index_dir, version)
+            index = index_factory.configure_search(relevant_utilis.load_index(version_dir))
+            store = chunk_store.open_store(version_dir)
+            self._snapshot = IndexSnapshot(version=version, index=index, store=store)
+            self._pointer_stamp = stamp
+            return self._snapshot
+        finally:
+            self._reload_lock.release()
+
+    def snapshot(self) -> Optional[IndexSnapshot]:
+        """
+        Current snapshot. Only the very first load blocks; when another process publishes
+        a version the reload runs in a background thread and callers keep the old snapshot.
+        """
+        if self._snapshot is None:
+            return self.refresh()
+        if self._stamp() != self._pointer_stamp and not self._reload_lock.locked():
+            threading.Thread(target=self.refresh, kwargs={"blocking": False}, daemon=True).start()
+        return self._snapshot
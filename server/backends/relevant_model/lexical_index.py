@@ -0,0 +1,204 @@
+"""
+BM25 inverted index over the rows of a chunk store, written into the same
+version directory and memory-mapped on open:
+
+    bm25.json               {"format", "rows", "live_rows", "avg_len", "terms": [sorted vocabulary]}
+    bm25_offsets.npy        int64   postings of term t are [offsets[t], offsets[t+1])
+    bm25_rows.npy           int32   chunk store row of every posting, ascending within a term
+    bm25_tf.npy             uint16  term frequency of every posting
+    bm25_len.npy            int32   token count of every row (0 for deleted rows)
+
+Dense embeddings blur exact identifiers (form numbers, clause ids, part codes);
+the tokenizer keeps them whole ("w-2", "4.3.1") and also indexes their
+separator-free form and parts, so "W2", "w-2" and "W 2" all match.
+"""
+import os
+import re
+import json
+import logging
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INFO_FILE = "bm25.json"
+FORMAT_VERSION = 1
+K1 = 1.2
+B = 0.75
+
+_TOKEN = re.compile(r"[^\W_]+(?:[-./:][^\W_]+)*")
+_SEPARATORS = re.compile(r"[-./:]")
+
+
+def _path(index_dir, name):
+    return os.path.join(index_dir, f"bm25_{name}.npy")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; compound identifiers also yield their joined form and parts."""
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        parts = _SEPARATORS.split(token)
+        if len(parts) > 1:
+            tokens.append("".join(parts))
+            tokens.extend(parts)
+    return tokens
+
+
+def exists(index_dir) -> bool:
+    return os.path.exists(os.path.join(index_dir, INFO_FILE))
+
+
+# -------------------------------
+# READER
+# -------------------------------
+class LexicalIndex:
+    """Read-only BM25 index; postings stay mmapped, only the vocabulary is loaded."""
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, INFO_FILE), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        self.terms: List[str] = info["terms"]
+        self.term_ids: Dict[str, int] = {t: i for i, t in enumerate(self.terms)}
+        self.rows_total: int = info["rows"]
+        self.live_rows: int = info["live_rows"]
+        self.avg_len: float = info["avg_len"] or 1.0
+        self.offsets = np.load(_path(index_dir, "offsets"), mmap_mode="r")
+        self.rows = self._load(_path(index_dir, "rows"))
+        self.tf = self._load(_path(index_dir, "tf"))
+        self.lengths = self._load(_path(index_dir, "len"))
+
+    @staticmethod
+    def _load(path):
+        arr = np.load(path, mmap_mode="r")
+        return arr if arr.size else np.asarray(arr)
+
+    def postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.rows[start:end], self.tf[start:end]
+
+    def search(self, query: str, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (scores, rows) by BM25, best first; both empty when no term matches."""
+        term_ids = [self.term_ids[t] for t in dict.fromkeys(tokenize(query)) if t in self.term_ids]
+        if not term_ids or not self.live_rows:
+            return np.zeros(0, dtype="float32"), np.zeros(0, dtype="int64")
+
+        rows, contributions = [], []
+        for t in term_ids:
+            t_rows, t_tf = self.postings(t)
+            df = len(t_rows)
+            if not df:
+                continue
+            idf = np.log(1 + (self.live_rows - df + 0.5) / (df + 0.5))
+            tf = t_tf.astype("float32")
+            norm = K1 * (1 - B + B * self.lengths[t_rows] / self.avg_len)
+            rows.append(t_rows)
+            contributions.append(idf * tf * (K1 + 1) / (tf + norm))
+        if not rows:
+            return np.zeros(0, dtype="float32"), np.zeros(0, dtype="int64")
+
+        candidates, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions)).astype("float32")
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return scores[top], candidates[top].astype("int64")
+
+
+def open_index(index_dir) -> Optional[LexicalIndex]:
+    return LexicalIndex(index_dir) if exists(index_dir) else None
+
+
+# -------------------------------
+# WRITER
+# -------------------------------
+class LexicalIndexWriter:
+    """
+    Collects postings for appended rows and writes the index on close().
+    copy_from() carries the postings of an existing index over without
+    re-tokenising, so incremental updates only pay for the new rows.
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self._base: Optional[Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]] = None
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._lengths = array("i")
+
+    def add(self, row: int, text: str):
+        tokens = tokenize(text)
+        self._pad(row)
+        self._lengths.append(len(tokens))
+        for term, count in Counter(tokens).items():
+            rows, tfs = self._postings.setdefault(term, (array("i"), array("H")))
+            rows.append(row)
+            tfs.append(min(count, 65535))
+
+    def _pad(self, row: int):
+        # deleted rows carry no tokens
+        while len(self._lengths) < row:
+            self._lengths.append(0)
+
+    def copy_from(self, index: LexicalIndex, live: np.ndarray):
+        """
+        Take over the postings of index for rows 0..len(live)-1, dropping rows
+        where live is False. Must be called before any add().
+        """
+        term_of = np.repeat(np.arange(len(index.terms), dtype=np.int64), np.diff(np.asarray(index.offsets)))
+        rows = np.asarray(index.rows)
+        keep = live[rows] if len(rows) else np.zeros(0, dtype=bool)
+        self._base = (index.terms, term_of[keep], rows[keep], np.asarray(index.tf)[keep])
+        self._lengths = array("i", (np.asarray(index.lengths) * live).tolist())
+
+    def close(self, n_rows: int):
+        self._pad(n_rows)
+        new_terms = sorted(self._postings)
+        base_terms = self._base[0] if self._base else []
+        terms = sorted(set(base_terms).union(new_terms))
+        term_ids = {t: i for i, t in enumerate(terms)}
+
+        term_parts, row_parts, tf_parts = [], [], []
+        if self._base:
+            remap = np.array([term_ids[t] for t in base_terms], dtype=np.int64)
+            _, base_term, base_rows, base_tf = self._base
+            term_parts.append(remap[base_term])
+            row_parts.append(base_rows)
+            tf_parts.append(base_tf)
+        for term in new_terms:
+            rows, tfs = self._postings[term]
+            term_parts.append(np.full(len(rows), term_ids[term], dtype=np.int64))
+            row_parts.append(np.frombuffer(rows, dtype=np.int32))
+            tf_parts.append(np.frombuffer(tfs, dtype=np.uint16))
+
+        term_col = np.concatenate(term_parts) if term_parts else np.zeros(0, dtype=np.int64)
+        row_col = np.concatenate(row_parts).astype(np.int32) if row_parts else np.zeros(0, dtype=np.int32)
+        tf_col = np.concatenate(tf_parts).astype(np.uint16) if tf_parts else np.zeros(0, dtype=np.uint16)
+
+        # terms only deleted rows used disappear from the vocabulary
+        counts = np.bincount(term_col, minlength=len(terms))
+        used = counts > 0
+        term_col = (np.cumsum(used) - 1)[term_col]
+        terms = [t for t, u in zip(terms, used) if u]
+        order = np.lexsort((row_col, term_col))
+        offsets = np.concatenate(([0], np.cumsum(counts[used]))).astype(np.int64)
+
+        lengths = np.frombuffer(self._lengths, dtype=np.int32)[:n_rows]
+        live_rows = int(np.count_nonzero(lengths))
+        np.save(_path(self.index_dir, "offsets"), offsets)
+        np.save(_path(self.index_dir, "rows"), row_col[order])
+        np.save(_path(self.index_dir, "tf"), tf_col[order])
+        np.save(_path(self.index_dir, "len"), lengths)
+        info = {
+            "format": FORMAT_VERSION,
+            "rows": n_rows,
+            "live_rows": live_rows,
+            "avg_len": float(lengths.sum() / live_rows) if live_rows else 0.0,
+            "terms": terms,
+        }
+        with open(os.path.join(self.index_dir, INFO_FILE), "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False)
+        logger.info(f"Wrote BM25 index: {len(terms)} terms, {len(row_col)} postings, {live_rows} rows")
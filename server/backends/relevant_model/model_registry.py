@@ -0,0 +1,84 @@
+import os
+import threading
+import logging
+from sentence_transformers import SentenceTransformer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = "sentence-transformers/multi-qa-mpnet-base-dot-v1"
+DEFAULT_DEVICE = os.environ.get("RELEVANT_MODEL_DEVICE", "cpu")
+OFFLINE_MODEL_DIR = "offline_model"
+
+# (model_name, device) -> SentenceTransformer, shared by indexing and search
+_models = {}
+_lock = threading.Lock()
+warmup_state = {"status": "cold", "error": None}
+
+
+def _offline_dir(model_name):
+    """
+    The default model keeps using the historical offline_model/ folder,
+    any other model gets its own sibling folder.
+    """
+    if model_name == DEFAULT_MODEL_NAME:
+        return OFFLINE_MODEL_DIR
+    return f"{OFFLINE_MODEL_DIR}__{model_name.replace('/', '__')}"
+
+
+def _load_model(model_name, device):
+    offline_model_dir = _offline_dir(model_name)
+    if os.path.exists(offline_model_dir) and os.listdir(offline_model_dir):
+        logger.info(f"Loading SentenceTransformer from offline dir: {offline_model_dir}")
+        model = SentenceTransformer(offline_model_dir)
+    else:
+        logger.info(f"Downloading SentenceTransformer model: {model_name}")
+        model = SentenceTransformer(model_name)
+        if not os.path.exists(offline_model_dir):
+            os.makedirs(offline_model_dir)
+        model.save(offline_model_dir)
+        logger.info(f"Saved model to offline dir: {offline_model_dir}")
+    return model.to(device)
+
+
+def get_model(model_name=DEFAULT_MODEL_NAME, device=None):
+    """
+    Return the process-wide model for (model_name, device), loading it on first use.
+    """
+    key = (model_name, device or DEFAULT_DEVICE)
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            model = _load_model(*key)
+            _models[key] = model
+    return model
+
+
+def is_ready(model_name=DEFAULT_MODEL_NAME, device=None):
+    return (model_name, device or DEFAULT_DEVICE) in _models
+
+
+def warmup(model_name=DEFAULT_MODEL_NAME, device=None):
+    """
+    Load the model and run one tiny encode so the first search does not pay for it.
+    """
+    try:
+        warmup_state["status"] = "loading"
+        model = get_model(model_name, device)
+        model.encode(["warmup"], convert_to_numpy=True, normalize_embeddings=True)
+        warmup_state["status"] = "ready"
+        logger.info(f"Model warm: {model_name}")
+    except Exception as e:
+        warmup_state["status"] = "failed"
+        warmup_state["error"] = str(e)
+        logger.error(f"Model warmup failed: {e}", exc_info=True)
+
+
+def start_warmup(model_name=DEFAULT_MODEL_NAME, device=None):
+    """Warm the model in a background thread so startup is not blocked."""
+    thread = threading.Thread(target=warmup, args=(model_name, device), daemon=True)
+    thread.start()
+    return thread
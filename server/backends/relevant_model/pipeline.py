@@ -0,0 +1,95 @@
+import os
+import time
+import threading
+import logging
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backends.relevant_model import relevant_utilis
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# paragraphs per extract -> embed -> write step; peak memory scales with this, not the corpus
+INDEX_BATCH = int(os.environ.get("RELEVANT_INDEX_BATCH", "256"))
+
+
+def batched(iterable, n):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+
+class Progress:
+    """Thread-safe progress of the running indexing job, read by /relevant/train/status."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {"stage": "idle"}
+
+    def start(self, docs_total: int):
+        with self._lock:
+            self._state = {
+                "stage": "indexing",
+                "docs_total": docs_total,
+                "docs_done": 0,
+                "chunks_embedded": 0,
+                "started_at": time.time(),
+            }
+
+    def update(self, docs_done: int, chunks: int):
+        with self._lock:
+            self._state["docs_done"] = docs_done
+            self._state["chunks_embedded"] += chunks
+
+    def finish(self, stage: str = "done"):
+        with self._lock:
+            self._state["stage"] = stage
+            if "docs_total" in self._state:
+                self._state["docs_done"] = self._state["docs_total"]
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            state = dict(self._state)
+        if state["stage"] == "indexing":
+            elapsed = time.time() - state["started_at"]
+            done, total = state["docs_done"], state["docs_total"]
+            state["elapsed_s"] = round(elapsed, 1)
+            state["eta_s"] = round(elapsed / done * (total - done), 1) if done else None
+        return state
+
+
+def stream_into(writer, docs: List[Tuple[str, str]], index=None, progress: Optional[Progress] = None,
+                batch_size: Optional[int] = None) -> Dict[str, Tuple[int, int]]:
+    """
+    Extract -> embed -> write docs (a list of (path, doc_id)) in fixed-size batches.
+
+    Every batch is appended to the chunk store writer (text + vectors) and, when an
+    already trained index is given, added to it under ids equal to the new rows.
+    Returns {doc_id: (first_row, end_row)} for the documents that produced rows.
+    """
+    batch_size = batch_size or INDEX_BATCH
+    doc_order = {doc_id: i for i, (_, doc_id) in enumerate(docs)}
+    ranges: Dict[str, Tuple[int, int]] = {}
+
+    for batch in batched(relevant_utilis.iter_corpus(docs), batch_size):
+        first_row = len(writer)
+        embeddings = relevant_utilis.embed_texts([c["text"] for c in batch])
+        writer.extend(batch)
+        writer.add_vectors(embeddings)
+        if index is not None:
+            index.add_with_ids(embeddings, np.arange(first_row, first_row + len(batch), dtype="int64"))
+
+        for row, item in enumerate(batch, start=first_row):
+            start, _ = ranges.get(item["doc_id"], (row, row))
+            ranges[item["doc_id"]] = (start, row + 1)
+        if progress is not None:
+            # documents before the last one in this batch are fully embedded
+            progress.update(doc_order[batch[-1]["doc_id"]], len(batch))
+
+    return ranges
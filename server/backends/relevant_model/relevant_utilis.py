@@ -1,12 +1,16 @@
 import os
+import copy
 import json
 import faiss
 import numpy as np
 import re
+import time
 import logging
+from collections import deque
 from tqdm import tqdm
-from sentence_transformers import SentenceTransformer
 import fitz  # PyMuPDF
+from backends.relevant_model import model_registry, index_factory, chunker
+from services import executor, result_cache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,67 +19,176 @@ logger = logging.getLogger(__name__)
 # -------------------------------
 # PDF TEXT EXTRACTION
 # -------------------------------
+# extraction tasks run in the shared cpu pool; an indexing run keeps up to 2 * EXTRACT_WORKERS of them queued
+EXTRACT_WORKERS = int(os.environ.get("RELEVANT_EXTRACT_WORKERS", executor.CPU_WORKERS))
+EXTRACT_PAGES_PER_TASK = int(os.environ.get("RELEVANT_EXTRACT_PAGES_PER_TASK", "32"))
+# "layout": token-bounded chunks from PyMuPDF blocks with section headings (see chunker);
+# "paragraph": the original blank-line split, one row per paragraph
+CHUNKERS = ("layout", "paragraph")
+CHUNKER = os.environ.get("RELEVANT_CHUNKER", "layout")
+
+
 def extract_paragraphs_from_pdf(pdf_path):
     """
     Return list of (page_number, paragraph_text) pairs from a PDF.
     """
-    doc = fitz.open(pdf_path)
-    paragraphs = []
-    for i in range(doc.page_count):
-        page = doc.load_page(i)
-        text = page.get_text("text")
-        paras = [p.strip() for p in text.split("\n\n") if p.strip()]
-        for p in paras:
-            paragraphs.append((i + 1, p))
-    doc.close()
-    return paragraphs
+    return chunker.extract_paragraphs_from_pages(pdf_path)
 
 
-def create_corpus_from_folder(input_dir):
+def _extraction_tasks(docs, pages_per_task, layout=False):
+    """
+    Split every (path, doc_id) into page-range tasks, in document then page order.
+    Layout chunking needs whole documents (repeated headers/footers and heading
+    styles are judged across all pages), so it gets one task per document.
+    """
+    if layout:
+        return [(path, doc_id, 0, None) for path, doc_id in docs]
+    tasks = []
+    for path, doc_id in docs:
+        with fitz.open(path) as doc:
+            page_count = doc.page_count
+        for first in range(0, max(page_count, 1), pages_per_task):
+            tasks.append((path, doc_id, first, first + pages_per_task))
+    return tasks
+
+
+def _run_extraction_task(task):
+    path, _, first, last = task
+    if last is None:
+        return chunker.layout_units(path)
+    return chunker.extract_paragraphs_from_pages(path, first, last)
+
+
+def _submit_extraction_task(task):
+    """Queue task in the shared cpu pool; None while the pool is at its in-flight limit."""
+    path, _, first, last = task
+    try:
+        # tasks call into the chunker directly, so workers don't import this module (and the encoder)
+        if last is None:
+            return executor.cpu.submit("extract_pages", chunker.layout_units, path)
+        return executor.cpu.submit("extract_pages", chunker.extract_paragraphs_from_pages, path, first, last)
+    except executor.Overloaded:
+        return None
+
+
+def _chunk_tokens(model_name=model_registry.DEFAULT_MODEL_NAME):
+    """Token counter for the encoder, and the chunk size clamped to what it can read."""
+    model = model_registry.get_model(model_name)
+    limit = chunker.CHUNK_TOKENS
+    max_seq = getattr(model, "max_seq_length", None)
+    if max_seq:
+        limit = min(limit, max_seq - 2)  # [CLS] and [SEP]
+    # a private copy: the chunker tokenizes without truncation while searches encode with it on other
+    # threads, and a fast tokenizer switched between the two concurrently raises "Already borrowed"
+    tokenizer = getattr(model, "tokenizer", None)
+    return chunker.Tokens(copy.deepcopy(tokenizer) if tokenizer is not None else None), limit
+
+
+def iter_corpus(docs, workers=None, pages_per_task=None, mode=None):
     """
-    Returns list of dicts: {"doc_id", "page", "text", "chunk_id"} for each paragraph.
-    """
-    corpus = []
-    for fname in os.listdir(input_dir):
-        if not fname.lower().endswith(".pdf"):
-            continue
-        path = os.path.join(input_dir, fname)
-        paragraphs = extract_paragraphs_from_pdf(path)
-        for pidx, (page_no, paragraph) in enumerate(paragraphs):
-            item = {
-                "doc_id": fname,
+    Yield {"doc_id", "page", "para", "text", "chunk_id", "heading"} for every chunk of docs,
+    a list of (path, doc_id); mode is one of CHUNKERS (default CHUNKER).
+    Extraction runs in the shared cpu pool (executor.cpu), but results are consumed
+    in submission order, so chunk numbers (and chunk ids) match a serial run.
+    At most 2 * workers tasks are in flight, which bounds memory.
+    """
+    workers = EXTRACT_WORKERS if workers is None else workers
+    mode = mode or CHUNKER
+    if mode not in CHUNKERS:
+        raise ValueError(f"Unknown chunker '{mode}', expected one of {', '.join(CHUNKERS)}")
+    layout = mode == "layout"
+    tasks = _extraction_tasks(docs, pages_per_task or EXTRACT_PAGES_PER_TASK, layout)
+    if layout:
+        tokens, max_tokens = _chunk_tokens()
+
+    def ordered_results():
+        if workers <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                yield task, _run_extraction_task(task)
+            return
+        pending = deque()
+        todo = deque(tasks)
+        try:
+            while todo or pending:
+                # top up the window; when the pool is busy with other requests, make do with what's queued
+                while todo and len(pending) < 2 * workers:
+                    future = _submit_extraction_task(todo[0])
+                    if future is None:
+                        break
+                    pending.append((todo.popleft(), future))
+                if not pending:
+                    time.sleep(0.05)  # nothing of ours queued yet: wait for the pool to drain
+                    continue
+                task, future = pending.popleft()
+                yield task, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    para_counts = {}
+    for (_, doc_id, _, _), result in ordered_results():
+        pidx = para_counts.get(doc_id, 0)
+        if layout:
+            # packing needs the encoder's tokenizer, which only this process has loaded
+            chunks = chunker.pack(result, tokens, max_tokens=max_tokens)
+        else:
+            chunks = [(page_no, None, paragraph) for page_no, paragraph in result]
+        for page_no, heading, text in chunks:
+            yield {
+                "doc_id": doc_id,
                 "page": page_no,
-                "chunk_id": f"{fname}::p{page_no}::para{pidx}",
-                "text": paragraph,
+                "para": pidx,
+                "chunk_id": f"{doc_id}::p{page_no}::para{pidx}",
+                "text": text,
+                "heading": heading,
             }
-            corpus.append(item)
-    return corpus
+            pidx += 1
+        para_counts[doc_id] = pidx
+
+
+def create_corpus_from_pdf(path, fname):
+    """
+    Returns list of dicts: {"doc_id", "page", "para", "text", "chunk_id", "heading"} for each chunk of one PDF.
+    """
+    return list(iter_corpus([(path, fname)]))
+
+
+def create_corpus_from_folder(input_dir):
+    """
+    Returns list of dicts: {"doc_id", "page", "para", "text", "chunk_id", "heading"} for each chunk.
+    """
+    return list(iter_corpus([(os.path.join(input_dir, fname), fname) for fname in list_pdfs(input_dir)]))
+
+
+def list_pdfs(input_dir):
+    """Sorted PDF filenames in input_dir, so ids are assigned in a stable order."""
+    if not os.path.isdir(input_dir):
+        return []
+    return sorted(f for f in os.listdir(input_dir) if f.lower().endswith(".pdf"))
+
+
+def file_fingerprint(path, with_hash=True):
+    """
+    Return {"size", "mtime"} and, unless with_hash is False, the file's "sha256".
+    """
+    st = os.stat(path)
+    fp = {"size": st.st_size, "mtime": st.st_mtime}
+    if with_hash:
+        # memoised, so a hash taken while the upload streamed in is not recomputed
+        fp["sha256"] = result_cache.file_sha256(path)
+    return fp
 
 
 # -------------------------------
 # EMBEDDINGS + INDEXING
 # -------------------------------
-def build_embeddings(corpus, model_name="sentence-transformers/multi-qa-mpnet-base-dot-v1", batch_size=32):
+def build_embeddings(corpus, model_name=model_registry.DEFAULT_MODEL_NAME, batch_size=32):
     """
     Build embeddings for the corpus and return (embeddings, model).
-    Uses offline model directory if available.
+    The model comes from the shared registry, so it is only loaded once per process.
     """
     texts = [c["text"] for c in corpus]
-    offline_model_dir = "offline_model"
-
-    # Load or download model
-    if os.path.exists(offline_model_dir) and os.listdir(offline_model_dir):
-        logger.info(f"Loading SentenceTransformer from offline dir: {offline_model_dir}")
-        model = SentenceTransformer(offline_model_dir)
-    else:
-        logger.info(f"Downloading SentenceTransformer model: {model_name}")
-        model = SentenceTransformer(model_name)
-        if not os.path.exists(offline_model_dir):
-            os.makedirs(offline_model_dir)
-        model.save(offline_model_dir)
-        logger.info(f"Saved model to offline dir: {offline_model_dir}")
-
-    model = model.to("cpu")
+    model = model_registry.get_model(model_name)
 
     embeddings = model.encode(
         texts,
@@ -87,102 +200,241 @@ def build_embeddings(corpus, model_name="sentence-transformers/multi-qa-mpnet-ba
     return embeddings, model
 
 
-def build_faiss_index(embeddings, index_dir, metadata):
+def embed_texts(texts, model_name=model_registry.DEFAULT_MODEL_NAME, batch_size=32):
+    """
+    Normalised float32 embeddings for one batch of texts (no progress bar, for pipelines).
+    """
+    model = model_registry.get_model(model_name)
+    embeddings = model.encode(
+        texts,
+        batch_size=batch_size,
+        show_progress_bar=False,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    )
+    return np.ascontiguousarray(embeddings, dtype="float32")
+
+
+def build_faiss_index(embeddings, mode=None):
     """
-    Build and save a FAISS index from embeddings and metadata.
+    Build a FAISS index from embeddings; persisting it is the index store's job.
+    Vector ids are row numbers in the chunk store. mode is an index_factory mode
+    (flat / ivf_flat / ivf_pq / hnsw / auto), defaulting to RELEVANT_INDEX_MODE.
     """
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)  # cosine similarity with normalized embeddings
-    index.add(embeddings.astype("float32"))
+    return index_factory.build_index(embeddings, mode=mode)
 
+
+def save_index(index, index_dir, manifest=None):
+    """
+    Write the FAISS index and (optionally) the per-document manifest into index_dir.
+    """
     if not os.path.exists(index_dir):
         os.makedirs(index_dir)
 
     faiss.write_index(index, os.path.join(index_dir, "faiss_index.bin"))
-    with open(os.path.join(index_dir, "metadata.json"), "w", encoding="utf-8") as f:
-        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    if manifest is not None:
+        with open(os.path.join(index_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
 
-    logger.info(f"Saved FAISS index and metadata to {index_dir}")
-    return index
+    logger.info(f"Saved FAISS index to {index_dir}")
 
 
-def load_index_and_meta(index_dir):
+def load_manifest(index_dir):
     """
-    Load FAISS index and metadata from disk.
+    Load the per-document manifest, or None for indexes built before incremental updates.
     """
-    idx_path = os.path.join(index_dir, "faiss_index.bin")
-    meta_path = os.path.join(index_dir, "metadata.json")
+    path = os.path.join(index_dir, "manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
 
-    if not os.path.exists(idx_path) or not os.path.exists(meta_path):
-        raise FileNotFoundError("Index or metadata not found in " + index_dir)
 
-    index = faiss.read_index(idx_path)
-    with open(meta_path, "r", encoding="utf-8") as f:
-        metadata = json.load(f)
+def load_index(index_dir):
+    """
+    Load the FAISS index from disk.
+    """
+    idx_path = os.path.join(index_dir, "faiss_index.bin")
+    if not os.path.exists(idx_path):
+        raise FileNotFoundError("Index not found in " + index_dir)
 
-    logger.info(f"Loaded FAISS index and metadata from {index_dir}")
-    return index, metadata
+    index = faiss.read_index(idx_path)
+    logger.info(f"Loaded FAISS index from {index_dir}")
+    return index
 
 
 # -------------------------------
 # QUERYING
 # -------------------------------
-def query_index_with_context(query, index, metadata, model_name="sentence-transformers/multi-qa-mpnet-base-dot-v1", k=5, context_paras=0):
+SEARCH_MODES = ("dense", "lexical", "hybrid")
+SEARCH_MODE = os.environ.get("RELEVANT_SEARCH_MODE", "hybrid")
+# candidates each retriever contributes to hybrid fusion, and the RRF damping constant
+HYBRID_DEPTH = int(os.environ.get("RELEVANT_HYBRID_DEPTH", "20"))
+RRF_K = 60
+# quantised indexes (sq8 / ivf_sq8 / ivf_pq) fetch this many candidates and re-rank
+# them with the stored vectors; 0 returns the approximate scores as they are
+RERANK_CANDIDATES = int(os.environ.get("RELEVANT_RERANK_CANDIDATES", "50"))
+
+QUERY_CACHE_SIZE = int(os.environ.get("RELEVANT_QUERY_CACHE_SIZE", "4096"))
+QUERY_CACHE_TTL = float(os.environ.get("RELEVANT_QUERY_CACHE_TTL", "3600"))
+# (model_name, normalised query) -> embedding row
+query_embedding_cache = result_cache.LRUCache(QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+
+
+def normalize_query(query, lowercase=False):
+    """Collapse whitespace (and case, for lowercasing tokenizers); equal keys embed identically."""
+    query = " ".join(query.split())
+    return query.lower() if lowercase else query
+
+
+def embed_queries(queries, model_name=model_registry.DEFAULT_MODEL_NAME):
+    """
+    Embeddings for search queries, served from an LRU/TTL cache where possible.
+    Only distinct uncached queries go through the encoder, in one batch.
+    """
+    model = model_registry.get_model(model_name)
+    lowercase = getattr(getattr(model, "tokenizer", None), "do_lower_case", False)
+    keys = [(model_name, normalize_query(q, lowercase)) for q in queries]
+    rows = [query_embedding_cache.get(key) for key in keys]
+
+    missing = list(dict.fromkeys(key for key, row in zip(keys, rows) if row is None))
+    if missing:
+        encoded = embed_texts([text for _, text in missing], model_name, batch_size=len(missing))
+        fresh = {key: row.copy() for key, row in zip(missing, encoded)}
+        for key, row in fresh.items():
+            query_embedding_cache.put(key, row)
+        rows = [fresh[key] if row is None else row for key, row in zip(keys, rows)]
+    return np.ascontiguousarray(np.stack(rows), dtype="float32")
+
+
+def query_index_with_context(query, index, store, model_name=model_registry.DEFAULT_MODEL_NAME, k=5, context_paras=0):
     """
     Query FAISS index with a text query and return top-k results as list of dicts.
+    store is the ChunkStore whose row i describes vector id i.
     """
-    offline_model_dir = "offline_model"
-    if os.path.exists(offline_model_dir) and os.listdir(offline_model_dir):
-        logger.info(f"Loading SentenceTransformer from offline dir: {offline_model_dir}")
-        model = SentenceTransformer(offline_model_dir)
-    else:
-        logger.info(f"Downloading SentenceTransformer model: {model_name}")
-        model = SentenceTransformer(model_name)
-        if not os.path.exists(offline_model_dir):
-            os.makedirs(offline_model_dir)
-        model.save(offline_model_dir)
-        logger.info(f"Saved model to offline dir: {offline_model_dir}")
+    results = search_many([query], index, store, model_name, k, context_paras)[0]
+    logger.info(f"Query '{query}' returned {len(results)} results")
+    return results
 
-    model = model.to("cpu")
 
-    q_emb = model.encode([query], convert_to_numpy=True, normalize_embeddings=True)
-    D, I = index.search(q_emb, k)
+def search_many(queries, index, store, model_name=model_registry.DEFAULT_MODEL_NAME, k=5, context_paras=0,
+                mode=None):
+    """
+    Batched query_index_with_context: one encoder forward pass (for queries not
+    in the embedding cache) and one index.search over the whole query matrix.
+    mode is "dense", "lexical" (BM25 only, no encoder) or "hybrid" (both,
+    fused by reciprocal rank); default RELEVANT_SEARCH_MODE.
+    Returns one result list per query.
+    """
+    mode = mode or SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{mode}', expected one of {SEARCH_MODES}")
+    if mode != "dense" and store.lexical is None:
+        if mode == "lexical":
+            raise ValueError("Index has no BM25 postings yet; run POST /relevant/train or /relevant/rebuild")
+        mode = "dense"  # stores from before the BM25 index, until the next sync writes one
+
+    if mode == "lexical":
+        return [_hits_to_results(scores, ids, store, context_paras)
+                for scores, ids in lexical_search(queries, store, k)]
+
+    if mode == "dense":
+        q_emb = embed_queries(queries, model_name)
+        D, I = dense_search(q_emb, index, store, k)
+        return [_hits_to_results(D[row], I[row], store, context_paras) for row in range(len(queries))]
+
+    # hybrid: BM25 runs on this (io) thread too; a nested io job could wait behind the jobs waiting on it
+    depth = max(k, HYBRID_DEPTH)
+    lexical = lexical_search(queries, store, depth)
+    q_emb = embed_queries(queries, model_name)
+    D, I = dense_search(q_emb, index, store, depth)
 
     results = []
-    for rank, idx in enumerate(I[0], start=1):
-        if idx < 0 or idx >= len(metadata):
-            continue
-
-        meta = metadata[idx]
-        doc_id = meta["doc_id"]
-        page = meta["page"]
-        para_idx = int(meta["chunk_id"].split("para")[-1])
-
-        # Context paragraphs (same doc + page)
-        related = []
-        for offset in range(-context_paras, context_paras + 1):
-            ctx_idx = idx + offset
-            if (
-                0 <= ctx_idx < len(metadata)
-                and metadata[ctx_idx]["doc_id"] == doc_id
-                and metadata[ctx_idx]["page"] == page
-            ):
-                related.append(metadata[ctx_idx]["text"])
-
-        full_text = "\n\n".join(related)
-        cleaned_text = clean_text(full_text)
-
-        results.append(
-            {
-                "paragraph_with_context": cleaned_text,
-                "page": page,
-                "importance_rank": rank,
-                "score": float(D[0][rank - 1]),
-                "doc_id": doc_id,
-            }
-        )
+    for row in range(len(queries)):
+        dense_ids = I[row][(I[row] >= 0) & (I[row] < len(store))]
+        dense_ids = dense_ids[np.asarray(store.doc[dense_ids]) >= 0]
+        ids, fused = rrf_fuse([dense_ids, lexical[row][1]], k)
+        if store.vectors is not None:
+            scores = np.asarray(store.vectors[ids], dtype="float32") @ q_emb[row]
+        else:
+            dense = dict(zip(I[row].tolist(), D[row].tolist()))
+            scores = [dense.get(int(i)) for i in ids]
+        results.append(_hits_to_results(scores, ids, store, context_paras, fused=fused))
+    return results
 
-    logger.info(f"Query '{query}' returned {len(results)} results")
+
+def dense_search(q_emb, index, store, k=5):
+    """index.search, re-ranked from the store's vectors when the index only holds quantised codes."""
+    if RERANK_CANDIDATES and store.vectors is not None and index_factory.is_quantized(index):
+        _, I = index.search(q_emb, max(k, RERANK_CANDIDATES))
+        return index_factory.rerank(q_emb, I, store.vectors, k)
+    return index.search(q_emb, k)
+
+
+def lexical_search(queries, store, k=5):
+    """BM25 (scores, ids) per query from the store's inverted index; never touches the encoder."""
+    return [store.lexical.search(query, k) for query in queries]
+
+
+def rrf_fuse(rankings, k=5, c=RRF_K):
+    """
+    Reciprocal rank fusion of several best-first id lists:
+    score(id) = sum over lists of 1 / (c + rank). Returns the top-k (ids, scores).
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, idx in enumerate(np.asarray(ranking).tolist(), start=1):
+            fused[idx] = fused.get(idx, 0.0) + 1.0 / (c + rank)
+    best = sorted(fused.items(), key=lambda item: -item[1])[:k]
+    return np.array([i for i, _ in best], dtype="int64"), np.array([f for _, f in best], dtype="float32")
+
+
+def _hits_to_results(scores, ids, store, context_paras, fused=None):
+    """
+    Turn one query's hits into result dicts. Each hit's context window is the
+    slice [id - context, id + context] clipped to its page run; a window that
+    overlaps one from a better-ranked hit is merged into it rather than returned twice.
+    scores may hold None (no dense score); fused, when given, adds "fused_score".
+    """
+    ids = np.asarray(ids, dtype="int64")
+    ranks = np.arange(1, len(ids) + 1)
+    in_range = (ids >= 0) & (ids < len(store))  # FAISS pads missing hits with -1
+    ids, ranks = ids[in_range], ranks[in_range]
+    live = np.asarray(store.doc[ids]) >= 0  # tombstoned rows of removed documents
+    ids, ranks = ids[live], ranks[live]
+    if not len(ids):
+        return []
+
+    page_start, page_end = store.page_bounds(ids)
+    lo = np.maximum(ids - context_paras, page_start)
+    hi = np.minimum(ids + context_paras + 1, page_end)
+
+    # sweep each page's windows by start, merging overlaps into the best-ranked hit among them
+    windows = []  # [lo, hi, position in ids of the best hit, page_start]
+    for j in np.lexsort((lo, page_start)):
+        last = windows[-1] if windows else None
+        if last is not None and last[3] == page_start[j] and lo[j] < last[1]:
+            last[1] = max(last[1], hi[j])
+            last[2] = min(last[2], j)
+        else:
+            windows.append([lo[j], hi[j], j, page_start[j]])
+    windows.sort(key=lambda w: w[2])
+
+    results = []
+    for start, end, j, _ in windows:
+        idx = ids[j]
+        score = scores[ranks[j] - 1]
+        result = {
+            "paragraph_with_context": clean_text("\n\n".join(store.texts(int(start), int(end)))),
+            "page": int(store.page[idx]),
+            "importance_rank": int(ranks[j]),
+            "score": None if score is None else float(score),
+            "doc_id": store.docs[store.doc[idx]],
+            "heading": store.heading(int(idx)),
+        }
+        if fused is not None:
+            result["fused_score"] = float(fused[ranks[j] - 1])
+        results.append(result)
     return results
 
 
@@ -1,51 +1,128 @@
+import os
+import re
 import sys
-import requests
-from pathlib import Path
+import asyncio
+from collections import deque
+from typing import AsyncIterator, List
+from xml.sax.saxutils import escape, quoteattr
+from services import http_clients, credentials
 
-def azure_tts(voice: str, text: str, region: str, key: str, out_path: Path):
+# full-URL override (e.g. a local mock server); defaults to the region's Azure host
+TTS_URL = os.environ.get("AZURE_TTS_URL", "https://{region}.tts.speech.microsoft.com/cognitiveservices/v1")
+OUTPUT_FORMAT = "audio-16khz-32kbitrate-mono-mp3"
+
+# scripts are synthesised as sentence-aligned segments, CONCURRENCY at a time; the first
+# segment is kept short so audio starts flowing quickly
+SEGMENT_CHARS = int(os.environ.get("AZURE_TTS_SEGMENT_CHARS", "1500"))
+FIRST_SEGMENT_CHARS = int(os.environ.get("AZURE_TTS_FIRST_SEGMENT_CHARS", "300"))
+CONCURRENCY = int(os.environ.get("AZURE_TTS_CONCURRENCY", "4"))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# time-to-first-audio of /v1/audio, reported by /exec/stats
+stats = {"requests": 0, "segments": 0, "failed_streams": 0, "first_audio_ms_avg": None, "first_audio_ms_max": None, "first_audio_ms_last": None}
+
+
+def record_first_audio(seconds: float):
+    ms = round(seconds * 1000, 1)
+    n = stats["requests"] = stats["requests"] + 1
+    avg = stats["first_audio_ms_avg"] or 0.0
+    stats["first_audio_ms_avg"] = round(avg + (ms - avg) / n, 1)
+    stats["first_audio_ms_max"] = max(stats["first_audio_ms_max"] or 0.0, ms)
+    stats["first_audio_ms_last"] = ms
+
+
+def split_segments(text: str, max_chars: int = SEGMENT_CHARS, first_chars: int = FIRST_SEGMENT_CHARS) -> List[str]:
     """
-    Generate TTS using Azure and write audio to out_path.
+    Split text at sentence boundaries into segments of at most max_chars
+    (the first one at most first_chars); a longer sentence is split between words.
     """
-    try:
-        print("[Azure TTS] Ensuring output directory exists...")
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-
-        # Request token
-        token_url = f"https://{region}.api.cognitive.microsoft.com/sts/v1.0/issueToken"
-        print("[Azure TTS] Requesting access token...")
-        token_resp = requests.post(token_url, headers={"Ocp-Apim-Subscription-Key": key}, timeout=10)
-        print("[Azure TTS] Token status code:", token_resp.status_code)
-        if token_resp.status_code != 200:
-            raise Exception(f"Token request failed: {token_resp.status_code}, {token_resp.text}")
-        access_token = token_resp.text
-        print("[Azure TTS] Token acquired.")
-
-        # Prepare SSML
-        ssml = f"<speak version='1.0' xml:lang='en-US'><voice name='{voice}'>{text}</voice></speak>"
-
-        # TTS request
-        tts_url = f"https://{region}.tts.speech.microsoft.com/cognitiveservices/v1"
-        print("[Azure TTS] Sending TTS request...")
-        resp = requests.post(
-            tts_url,
+    pieces = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if sentence:
+            pieces.append(sentence)
+
+    segments, current = [], ""
+    for piece in pieces:
+        limit = first_chars if not segments else max_chars
+        if current and len(current) + 1 + len(piece) > limit:
+            segments.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        segments.append(current)
+    return segments
+
+
+def build_ssml(voice: str, text: str) -> str:
+    # script text is model output: escape it so &, < and > can't break the document
+    return f"<speak version='1.0' xml:lang='en-US'><voice name={quoteattr(voice)}>{escape(text)}</voice></speak>"
+
+
+async def synthesize(voice: str, text: str, region: str, key: str) -> bytes:
+    """MP3 bytes for one segment of text."""
+    tts_url = TTS_URL.format(region=region)
+    for attempt in range(2):
+        # cached bearer token, fetched only when missing or expired
+        access_token = await credentials.azure_tokens.token(region, key)
+        resp = await http_clients.request(
+            "azure_tts", "POST", tts_url,
             headers={
                 "Authorization": f"Bearer {access_token}",
                 "Content-Type": "application/ssml+xml",
-                "X-Microsoft-OutputFormat": "audio-16khz-32kbitrate-mono-mp3"
+                "X-Microsoft-OutputFormat": OUTPUT_FORMAT
             },
-            data=ssml.encode("utf-8"),
-            timeout=30
+            content=build_ssml(voice, text).encode("utf-8"),
         )
-        print("[Azure TTS] TTS response status:", resp.status_code)
-        resp.raise_for_status()
-
-        if not resp.content:
-            raise Exception("Azure TTS returned empty audio content")
+        if resp.status_code != 401 or attempt:
+            break
+        # token revoked or expired early: drop it and fetch a fresh one once
+        credentials.azure_tokens.invalidate(region, key)
+    resp.raise_for_status()
+    if not resp.content:
+        raise Exception("Azure TTS returned empty audio content")
+    return resp.content
 
-        with open(out_path, "wb") as f:
-            f.write(resp.content)
-        print(f"[Azure TTS] Audio written to {out_path} (size={out_path.stat().st_size} bytes)")
 
+async def stream_tts(voice: str, text: str, region: str, key: str, concurrency: int = CONCURRENCY) -> AsyncIterator[bytes]:
+    """
+    Yield the MP3 audio of text segment by segment, in order. Up to concurrency
+    segments are synthesised at once; MP3 frames concatenate, so the pieces
+    form one playable stream. Pending segments are cancelled if the consumer stops
+    or a segment fails.
+    """
+    segments = split_segments(text)
+    print(f"[Azure TTS] Synthesising {len(segments)} segments, {concurrency} at a time...")
+    stats["segments"] += len(segments)
+    todo = iter(segments)
+    pending = deque()
+    sent = 0
+    try:
+        for segment in todo:
+            pending.append(asyncio.create_task(synthesize(voice, segment, region, key)))
+            if len(pending) >= concurrency:
+                break
+        while pending:
+            audio = await pending.popleft()
+            next_segment = next(todo, None)
+            if next_segment is not None:
+                pending.append(asyncio.create_task(synthesize(voice, next_segment, region, key)))
+            yield audio
+            sent += 1
     except Exception as e:
-        print(f"[Azure TTS] Error: {e}", file=sys.stderr)
+        # once audio is out the response can't turn into an error, so this is the only trace of the truncation
+        stats["failed_streams"] += 1
+        print(f"[Azure TTS] Segment {sent + 1}/{len(segments)} failed, stream ends after {sent}: {e}", file=sys.stderr)
         raise
+    finally:
+        for task in pending:
+            task.cancel()
+        # collect cancelled and finished segments so none ends as "Task exception was never retrieved"
+        await asyncio.gather(*pending, return_exceptions=True)
+
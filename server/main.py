@@ -1,11 +1,35 @@
-from fastapi import FastAPI
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 
 # Import your routers
-from routers import tts, files, model_relevant, model_a,llm 
+from routers import tts, files, model_relevant, model_a,llm, system
+from backends.relevant_model import model_registry
+from services import executor, http_clients
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the embedding model in the background; /relevant/ready reports when it is done.
+    # Set RELEVANT_MODEL_WARMUP=0 to load lazily on the first search instead.
+    if os.environ.get("RELEVANT_MODEL_WARMUP", "1") != "0":
+        model_registry.start_warmup()
+    yield
+    await http_clients.aclose()
+    executor.shutdown()
+
+
+app = FastAPI(title="Unified Backend", lifespan=lifespan)
+
+
+@app.exception_handler(executor.Overloaded)
+async def overloaded_handler(request: Request, exc: executor.Overloaded):
+    # backpressure: the worker pools are full, ask the client to retry shortly
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "1"})
 
-app = FastAPI(title="Unified Backend")
 
 # Enable CORS
 app.add_middleware(
@@ -25,3 +49,4 @@ app.include_router(tts.router)
 app.include_router(model_relevant.router)
 app.include_router(model_a.router)
 app.include_router(llm.router)
+app.include_router(system.router)
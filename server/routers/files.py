@@ -1,7 +1,11 @@
-from fastapi import APIRouter, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.responses import FileResponse, StreamingResponse
+from typing import Optional
 import os
-from services.pdf_utils import extract_text_from_pdf
+import json
+import asyncio
+from services.pdf_utils import cached_extract_text, extract_pages_text, page_count, parse_page_range
+from services import relevant_service, result_cache, executor, uploads, blob_store, credentials, llm_cache
 
 # keep routes same as before (no /files prefix)
 router = APIRouter(tags=["files"])
@@ -11,6 +15,63 @@ BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # project root
 UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# pages extracted per process-pool job while streaming NDJSON
+STREAM_PAGES_PER_TASK = int(os.environ.get("TEXT_STREAM_PAGES_PER_TASK", "4"))
+
+PAGES_QUERY = Query(None, description="1-based inclusive page range, e.g. 10-20")
+STREAM_QUERY = Query(False, description="Stream application/x-ndjson, one line per page")
+
+
+async def _extract_pages(path, first, end, retry=False):
+    while True:
+        try:
+            return await executor.cpu.run("extract_pages", extract_pages_text, path, first, end)
+        except executor.Overloaded:
+            # mid-stream the status line is already sent, so wait for room instead of failing
+            if not retry:
+                raise
+            await asyncio.sleep(0.05)
+
+
+async def _text_response(path: str, body: dict, pages: Optional[str], stream: bool):
+    """
+    Add the text of path to body: the whole document (cached) by default, only
+    the requested page range with pages=, or as an NDJSON stream with stream=true.
+    """
+    if not pages and not stream:
+        body["text"] = await executor.io.run(
+            "extract_text", cached_extract_text, path, executor.offload("extract_text")
+        )
+        return body
+
+    total = await executor.io.run("page_count", page_count, path)
+    try:
+        first, end = parse_page_range(pages, total) if pages else (0, total)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    body["pages"] = {"first": first + 1, "last": end, "total": total}
+
+    if not stream:
+        body["text"] = "".join(await _extract_pages(path, first, end)).strip()
+        return body
+
+    # the first batch runs before the response starts, so a full pool is still a 429
+    head_end = min(end, first + STREAM_PAGES_PER_TASK)
+    head = await _extract_pages(path, first, head_end)
+
+    async def lines():
+        yield json.dumps(body, ensure_ascii=False) + "\n"
+        batch, batch_first = head, first
+        while True:
+            for number, text in enumerate(batch, start=batch_first + 1):
+                yield json.dumps({"page": number, "text": text}, ensure_ascii=False) + "\n"
+            batch_first += len(batch)
+            if batch_first >= end:
+                break
+            batch = await _extract_pages(path, batch_first, min(end, batch_first + STREAM_PAGES_PER_TASK), retry=True)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 
 @router.get("/uploads/{filename}")
 async def get_uploaded_file(filename: str):
@@ -22,50 +83,64 @@ async def get_uploaded_file(filename: str):
 
 @router.get("/files")
 async def list_files():
-    return {"files": os.listdir(UPLOAD_FOLDER)}
+    return {"files": uploads.list_uploads(UPLOAD_FOLDER)}
 
 
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...), action: str = "normal"):
+async def upload_file(file: UploadFile = File(...), action: str = "normal",
+                      pages: Optional[str] = PAGES_QUERY, stream: bool = STREAM_QUERY):
     save_path = os.path.join(UPLOAD_FOLDER, file.filename)
 
     if os.path.exists(save_path) and action == "normal":
         return {"error": "File exists"}
 
-    if action == "overwrite" and os.path.exists(save_path):
-        os.remove(save_path)
-
-    with open(save_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
-
-    extracted_text = extract_text_from_pdf(save_path)
+    if os.path.exists(save_path):
+        await executor.io.run("invalidate_cache", result_cache.invalidate_file, save_path)
+    # streamed to a temp file and linked over save_path, which also covers "overwrite"
+    stored = await uploads.save_upload(file, save_path)
 
-    return {"status": "success", "filename": file.filename, "text": extracted_text}
+    body = {"status": "success", "filename": file.filename, "duplicate_of": stored["duplicate_of"]}
+    return await _text_response(save_path, body, pages, stream)
 
 
 @router.get("/process/{filename}")
-async def process_existing_file(filename: str):
+async def process_existing_file(filename: str, pages: Optional[str] = PAGES_QUERY, stream: bool = STREAM_QUERY):
     path = os.path.join(UPLOAD_FOLDER, filename)
     if not os.path.exists(path):
         return {"error": "File not found"}
 
-    extracted_text = extract_text_from_pdf(path)
-
-    return {"status": "processed", "filename": filename, "text": extracted_text}
+    return await _text_response(path, {"status": "processed", "filename": filename}, pages, stream)
 
 
 @router.delete("/delete/{filename}")
 async def delete_file(filename: str):
     path = os.path.join(UPLOAD_FOLDER, filename)
     if os.path.exists(path):
+        await executor.io.run("invalidate_cache", result_cache.invalidate_file, path)
         os.remove(path)
+        await executor.io.run("remove_from_index", relevant_service.remove_pdfs, [filename])
+        await executor.io.run("blob_gc", blob_store.gc, UPLOAD_FOLDER)
         return {"status": "deleted"}
     return {"error": "File not found"}
 
 
+def _remove_uploads():
+    # hashing for the cache invalidation reads each file when the memo is cold, so this runs on the io pool
+    for f in uploads.list_uploads(UPLOAD_FOLDER):
+        result_cache.invalidate_file(os.path.join(UPLOAD_FOLDER, f))
+        os.remove(os.path.join(UPLOAD_FOLDER, f))
+
+
 @router.delete("/clear")
 async def clear_uploads():
-    for f in os.listdir(UPLOAD_FOLDER):
-        os.remove(os.path.join(UPLOAD_FOLDER, f))
+    await executor.io.run("remove_uploads", _remove_uploads)
+    await executor.io.run("remove_from_index", relevant_service.remove_pdfs)
+    await executor.io.run("blob_gc", blob_store.gc, UPLOAD_FOLDER)
     return {"status": "cleared"}
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters of the extraction, search, podcast and LLM response caches, and upstream credentials."""
+    return {**result_cache.all_stats(), "search": relevant_service.cache_stats(), "credentials": credentials.stats(),
+            "llm": llm_cache.responses.summary()}
@@ -2,7 +2,8 @@ import os
 import logging
 from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import JSONResponse
-from services.enhanced_extractor import extract_outline_from_pdf
+from services.enhanced_extractor import cached_extract_outline
+from services import executor
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -16,7 +17,10 @@ UPLOAD_DIRECTORY = "uploads"
 os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
 
 @router.get("/extract-outline/")
-async def extract_outline(file_name: str = Query(..., description="PDF file name in uploads folder")):
+async def extract_outline(
+    file_name: str = Query(..., description="PDF file name in uploads folder"),
+    tables: bool = Query(False, description="Drop heading candidates inside tables (slower: runs table analysis on candidate pages)"),
+):
     """
     Extract outline for a PDF file already in the uploads folder.
     """
@@ -26,7 +30,9 @@ async def extract_outline(file_name: str = Query(..., description="PDF file name
 
     try:
         logger.info(f"Starting outline extraction for {file_name}...")
-        extracted_data = extract_outline_from_pdf(file_path)
+        extracted_data = await executor.io.run(
+            "extract_outline", cached_extract_outline, file_path, tables, executor.offload("extract_outline")
+        )
         logger.info(f"Extraction successful for {file_name}.")
 
         return JSONResponse(
@@ -36,6 +42,8 @@ async def extract_outline(file_name: str = Query(..., description="PDF file name
                 "data": extracted_data
             }
         )
+    except executor.Overloaded:
+        raise
     except Exception as e:
         logger.error(f"Error processing {file_name}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
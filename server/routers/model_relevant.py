@@ -1,13 +1,17 @@
-from fastapi import APIRouter, UploadFile, BackgroundTasks, File
-from typing import List
-import os, shutil
+from fastapi import APIRouter, UploadFile, BackgroundTasks, File, HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from typing import List, Optional
+import os
 from enum import Enum
 
-from services import relevant_service
+from services import relevant_service, result_cache, executor, uploads, search_batcher
+from backends.relevant_model import model_registry, relevant_utilis
 
 router = APIRouter(prefix="/relevant", tags=["Relevant Model"])
 
 UPLOAD_DIR = "uploads"
+MAX_BATCH_QUERIES = 256
 
 @router.post("/upload")
 async def upload_files(files: List[UploadFile]):
@@ -16,11 +20,11 @@ async def upload_files(files: List[UploadFile]):
     
     for file in files:
         file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        await executor.io.run("invalidate_cache", result_cache.invalidate_file, file_path)
+        await uploads.save_upload(file, file_path)
     
-    # Re-index PDFs after upload
-    result = relevant_service.index_pdfs()
+    # Embed only the new or changed PDFs
+    result = await executor.io.run("index_pdfs", relevant_service.index_pdfs)
     return {"status": "success", "details": result}
 
 
@@ -33,11 +37,14 @@ class TrainingStatus(str, Enum):
 
 training_state = {"status": TrainingStatus.idle}
 
-def run_training():
+def run_training(full: bool = False):
     try:
         training_state["status"] = TrainingStatus.running
         # your heavy blocking function
-        relevant_service.index_pdfs()
+        if full:
+            relevant_service.rebuild_index()
+        else:
+            relevant_service.index_pdfs()
         training_state["status"] = TrainingStatus.done
     except Exception as e:
         training_state["status"] = TrainingStatus.failed
@@ -48,11 +55,54 @@ async def train(background_tasks: BackgroundTasks):
     background_tasks.add_task(run_training)
     return {"status": "training started"}
 
+@router.post("/rebuild")
+async def rebuild(background_tasks: BackgroundTasks):
+    """Maintenance: re-extract and re-embed every PDF and compact the index."""
+    background_tasks.add_task(run_training, True)
+    return {"status": "rebuild started"}
+
 @router.get("/train/status")
 async def train_status():
-    return training_state
+    return {**training_state, "progress": relevant_service.progress.snapshot()}
 
 @router.get("/search")
-async def search(query: str, k: int = 5, context: int = 0):
-    results = relevant_service.query_pdfs(query=query, k=k, context=context)
+async def search(query: str, k: int = 5, context: int = 0, mode: Optional[str] = None):
+    """mode: dense, lexical (BM25 only, no batching) or hybrid; default RELEVANT_SEARCH_MODE."""
+    if mode is not None and mode not in relevant_utilis.SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {relevant_utilis.SEARCH_MODES}")
+    if mode == "lexical":
+        # no encoder pass to share, but index loading and BM25 scoring still stay off the event loop
+        results = await executor.io.run("search_lexical", relevant_service.query_pdfs, query, k, context, mode)
+        return {"results": results}
+    # concurrent searches arriving within a few ms are encoded and searched together
+    results = await search_batcher.search.submit((k, context, mode), query)
     return {"results": results}
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    k: int = 5
+    context: int = 0
+    mode: Optional[str] = None
+
+
+@router.post("/search/batch")
+async def search_batch(req: BatchSearchRequest):
+    """Many queries in one encoder pass and one index search, results in query order."""
+    if len(req.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+    if req.mode is not None and req.mode not in relevant_utilis.SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {relevant_utilis.SEARCH_MODES}")
+    if not req.queries:
+        return {"results": []}
+    batches = await executor.io.run(
+        "search_batch", relevant_service.query_pdfs_batch, req.queries, req.k, req.context, req.mode
+    )
+    return {"results": [{"query": q, "results": r} for q, r in zip(req.queries, batches)]}
+
+
+@router.get("/ready")
+async def ready():
+    """Readiness probe: 200 once the embedding model is loaded, 503 until then."""
+    body = {"ready": model_registry.is_ready(), "warmup": model_registry.warmup_state}
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+
+from services import executor, search_batcher
+from backends.tts import generate_audio
+
+router = APIRouter(tags=["System"])
+
+
+@router.get("/exec/stats")
+async def exec_stats():
+    """In-flight jobs, rejections and queue wait / run time per pool and operation, plus TTS time-to-first-audio."""
+    return {**executor.all_stats(), "search_batching": search_batcher.search.stats, "tts": generate_audio.stats}
@@ -1,38 +1,42 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict
-from pathlib import Path
 import os
-import requests
+import time
 import json
+import asyncio
+import hashlib
 from urllib.parse import urlparse
-from backends.tts.generate_audio import azure_tts
+from backends.tts.generate_audio import stream_tts, record_first_audio, OUTPUT_FORMAT
+from services import http_clients, credentials
+from services.result_cache import DiskCache
 
 router = APIRouter(prefix="/v1/audio", tags=["TTS"])
 
+VOICE = "en-US-DavisNeural"
+# bump whenever the script prompt changes, it keys the script cache
+SCRIPT_PROMPT_VERSION = "1"
+# podcast scripts by hash of (model, insights JSON); audio by hash of (script, voice, format)
+SCRIPT_CACHE = DiskCache("podcast_scripts", int(float(os.environ.get("PODCAST_SCRIPT_CACHE_MB", "16")) * 2**20), ".json")
+AUDIO_CACHE = DiskCache("podcast_audio", int(float(os.environ.get("PODCAST_AUDIO_CACHE_MB", "512")) * 2**20), ".mp3")
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
 class AudioRequest(BaseModel):
     text: Dict
 
-def get_gemini_api_key() -> str:
-    # Get path to JSON credentials
-    gcp_credentials_path = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
-    if not gcp_credentials_path or not os.path.exists(gcp_credentials_path):
-        raise Exception("GOOGLE_APPLICATION_CREDENTIALS not set or file missing")
-    
-    # Load JSON and extract API key
-    with open(gcp_credentials_path, "r") as f:
-        creds = json.load(f)
-    api_key = creds.get("api_key")
-    if not api_key:
-        raise Exception("GEMINI API key not found in credentials JSON")
-    return api_key
-
-def generate_script_from_llm(text: dict) -> List[Dict]:
+async def generate_script_from_llm(text: dict) -> List[Dict]:
+    gemini_model = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
+    key = _digest(SCRIPT_PROMPT_VERSION, gemini_model, text)
+    cached = await asyncio.to_thread(SCRIPT_CACHE.get, key)
+    if cached is not None:
+        return json.loads(cached)
     try:
-        api_key = get_gemini_api_key()
-        gemini_model = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{gemini_model}:generateContent"
+        api_key = credentials.gemini_api_key()
+        url = f"/v1beta/models/{gemini_model}:generateContent"
         headers = {"Content-Type": "application/json", "X-goog-api-key": api_key}
         prompt = (
             f"Generate an engaging, natural-sounding audio script for an overview. "
@@ -41,37 +45,40 @@ def generate_script_from_llm(text: dict) -> List[Dict]:
         )
 
         payload = {"contents": [{"parts": [{"text": prompt}]}]}
-        for attempt in range(2):
-            try:
-                resp = requests.post(url, headers=headers, json=payload, timeout=25)
-                resp.raise_for_status()
-                generated_text = resp.json()["candidates"][0]["content"]["parts"][0]["text"]
-                return [{"speaker": "sp1", "text": generated_text}]
-            except Exception:
-                if attempt == 1:
-                    return [{"speaker": "sp1", "text": "Error generating script."}]
+        # retries (backoff, Retry-After) happen inside the shared client
+        resp = await http_clients.request("gemini", "POST", url, headers=headers, json=payload, timeout=25)
+        resp.raise_for_status()
+        generated_text = resp.json()["candidates"][0]["content"]["parts"][0]["text"]
+        script = [{"speaker": "sp1", "text": generated_text}]
     except Exception:
         return [{"speaker": "sp1", "text": "Error generating script."}]
-
-def delete_file(path: Path):
-    try:
-        if path.exists():
-            path.unlink()
-    except:
-        pass
+    # only real scripts are cached, a failed call is retried next time
+    await asyncio.to_thread(SCRIPT_CACHE.put, key, json.dumps(script, ensure_ascii=False).encode("utf-8"))
+    return script
 
 @router.post("/")
-def create_audio(req: AudioRequest):
-    script_turns = generate_script_from_llm(req.text)
+async def create_audio(req: AudioRequest):
+    started = time.monotonic()
+    script_turns = await generate_script_from_llm(req.text)
     full_text = " ".join([t["text"] for t in script_turns])
 
-    try:
-        media_dir = Path("storage/media")
-        media_dir.mkdir(parents=True, exist_ok=True)
-        temp_file = media_dir / "output.mp3"
-        background_tasks = BackgroundTasks()
-        background_tasks.add_task(delete_file, temp_file)
+    audio_key = _digest(full_text, VOICE, OUTPUT_FORMAT)
+    # read hits up front (a few MB at most): eviction may delete the file while a FileResponse still sends it
+    cached = await asyncio.to_thread(AUDIO_CACHE.get, audio_key)
+    if cached is not None:
+        first_audio = time.monotonic() - started
+        record_first_audio(first_audio)
+        return Response(
+            content=cached,
+            media_type="audio/mpeg",
+            headers={
+                "Content-Disposition": 'attachment; filename="output.mp3"',
+                "X-Time-To-First-Audio-Ms": f"{first_audio * 1000:.0f}",
+                "X-Cache": "hit",
+            },
+        )
 
+    try:
         # Azure credentials from environment
         AZURE_KEY = os.environ.get("AZURE_TTS_KEY")
         AZURE_ENDPOINT = os.environ.get("AZURE_TTS_ENDPOINT")
@@ -83,14 +90,29 @@ def create_audio(req: AudioRequest):
         parsed_url = urlparse(AZURE_ENDPOINT)
         AZURE_REGION = parsed_url.netloc.split(".")[0]  # e.g., 'centralindia'
 
-        # Generate audio
-        azure_tts("en-US-DavisNeural", full_text, AZURE_REGION, AZURE_KEY, temp_file)
+        # Generate audio; the first segment is awaited here so failures still return a 500
+        audio = stream_tts(VOICE, full_text, AZURE_REGION, AZURE_KEY)
+        first = await audio.__anext__()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"TTS failed: {e}")
+    first_audio = time.monotonic() - started
+    record_first_audio(first_audio)
+
+    async def body():
+        chunks = [first]
+        yield first
+        async for chunk in audio:
+            chunks.append(chunk)
+            yield chunk
+        # only complete audio is cached; a client that disconnects early stops this generator first
+        await asyncio.to_thread(AUDIO_CACHE.put, audio_key, b"".join(chunks))
 
-    return FileResponse(
-        path=temp_file,
+    return StreamingResponse(
+        body(),
         media_type="audio/mpeg",
-        filename="output.mp3",
-        background=background_tasks
+        headers={
+            "Content-Disposition": 'attachment; filename="output.mp3"',
+            "X-Time-To-First-Audio-Ms": f"{first_audio * 1000:.0f}",
+            "X-Cache": "miss",
+        },
     )
@@ -0,0 +1,110 @@
+"""
+Content-addressed storage for uploaded PDFs.
+
+Every distinct file is stored once as <uploads>/.blobs/<sha[:2]>/<sha>.pdf and
+each uploaded filename is a hard link to its blob, so code that opens
+uploads/<name> keeps working while duplicates take no extra disk. The blob
+directory lives inside uploads so links never cross a filesystem; where hard
+links are unsupported the alias falls back to a plain copy.
+"""
+import os
+import shutil
+import logging
+import threading
+from typing import Dict, List
+
+from services import result_cache
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = ".blobs"
+
+# store() and gc() both inspect link counts; keep them from interleaving
+_lock = threading.Lock()
+# folder -> (dir mtime_ns, {sha256: [aliases]})
+_alias_maps: Dict[str, tuple] = {}
+
+
+def blob_path(folder: str, digest: str) -> str:
+    return os.path.join(folder, BLOB_DIR, digest[:2], f"{digest}.pdf")
+
+
+def _uploads(folder: str) -> List[str]:
+    return sorted(f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f)))
+
+
+def aliases_by_digest(folder: str) -> Dict[str, List[str]]:
+    """
+    {sha256: sorted filenames} for every upload in folder. Rebuilt only when the
+    folder's mtime changes (adds, deletes, renames); hashes come from result_cache's memo.
+    """
+    stamp = os.stat(folder).st_mtime_ns
+    cached = _alias_maps.get(folder)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    mapping: Dict[str, List[str]] = {}
+    for fname in _uploads(folder):
+        try:
+            digest = result_cache.file_sha256(os.path.join(folder, fname))
+        except FileNotFoundError:
+            continue
+        mapping.setdefault(digest, []).append(fname)
+    _alias_maps[folder] = (stamp, mapping)
+    return mapping
+
+
+def aliases(folder: str, digest: str) -> List[str]:
+    return aliases_by_digest(folder).get(digest, [])
+
+
+def store(tmp_path: str, digest: str, dest_path: str):
+    """
+    Move a fully written temp file into the blob store (or drop it when the
+    content is already there) and atomically point dest_path at the blob.
+    """
+    folder = os.path.dirname(dest_path)
+    blob = blob_path(folder, digest)
+    link_tmp = f"{tmp_path}.link"
+    replaced = os.path.exists(dest_path)
+    with _lock:
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        if not os.path.exists(blob):
+            existing = [a for a in aliases(folder, digest) if os.path.join(folder, a) != dest_path]
+            if existing:
+                # an upload from before the blob store: adopt its inode instead of storing a second copy
+                _link_or_copy(os.path.join(folder, existing[0]), blob)
+            else:
+                os.replace(tmp_path, blob)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        _link_or_copy(blob, link_tmp)
+        os.replace(link_tmp, dest_path)
+    result_cache.remember_sha256(dest_path, digest)
+    if replaced:
+        gc(folder)  # the overwritten content may have lost its last name
+
+
+def _link_or_copy(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        logger.warning(f"Hard links unsupported here, storing a copy of {os.path.basename(src)}")
+        shutil.copyfile(src, dst)
+
+
+def gc(folder: str) -> int:
+    """Delete blobs no filename links to any more. Returns the number removed."""
+    root = os.path.join(folder, BLOB_DIR)
+    removed = 0
+    if not os.path.isdir(root):
+        return removed
+    with _lock:
+        for dirpath, _, fnames in os.walk(root):
+            for fname in fnames:
+                path = os.path.join(dirpath, fname)
+                if os.stat(path).st_nlink <= 1:
+                    os.remove(path)
+                    removed += 1
+    if removed:
+        logger.info(f"Removed {removed} unreferenced blobs")
+    return removed
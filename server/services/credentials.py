@@ -0,0 +1,143 @@
+"""
+Secrets for upstream APIs, loaded once and kept current.
+
+The credentials JSON (GOOGLE_APPLICATION_CREDENTIALS) is parsed on first use
+and again only when its mtime or size changes; the file is stat'ed at most
+every CHECK_INTERVAL seconds. Azure speech bearer tokens are cached per
+(region, key) for their lifetime, refreshed in the background once they get
+old, and concurrent callers share a single in-flight refresh.
+"""
+import os
+import time
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from services import http_clients
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL = float(os.environ.get("CREDENTIALS_CHECK_INTERVAL", "2"))
+# Azure tokens are valid for 10 minutes: refresh in the background after 8, never hand one out after 9
+AZURE_TOKEN_REFRESH_AFTER = float(os.environ.get("AZURE_TOKEN_REFRESH_AFTER", "480"))
+AZURE_TOKEN_MAX_AGE = float(os.environ.get("AZURE_TOKEN_MAX_AGE", "540"))
+AZURE_TOKEN_URL = os.environ.get("AZURE_TTS_TOKEN_URL", "https://{region}.api.cognitive.microsoft.com/sts/v1.0/issueToken")
+
+
+class CredentialsError(Exception):
+    pass
+
+
+# -------------------------------
+# CREDENTIALS FILE
+# -------------------------------
+class CredentialsFile:
+    """Parsed JSON of one file, reloaded when the file changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._path: Optional[str] = None
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._checked = 0.0
+        self._data: Dict = {}
+        self.reloads = 0
+
+    def get(self, path: str) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            if path == self._path and now - self._checked < CHECK_INTERVAL:
+                return self._data
+            self._checked = now
+            try:
+                st = os.stat(path)
+            except OSError:
+                raise CredentialsError("GOOGLE_APPLICATION_CREDENTIALS not set or file missing")
+            stamp = (st.st_mtime_ns, st.st_size)
+            if path != self._path or stamp != self._stamp:
+                try:
+                    with open(path, "r") as f:
+                        data = json.load(f)
+                except (OSError, ValueError) as e:
+                    if path != self._path:
+                        raise CredentialsError(f"Cannot read credentials file: {e}")
+                    # caught mid-write: keep the last good copy and look again next time
+                    logger.warning(f"Credentials file unreadable, keeping previous values: {e}")
+                    return self._data
+                self._path, self._stamp, self._data = path, stamp, data
+                self.reloads += 1
+                logger.info(f"Loaded credentials from {path}")
+            return self._data
+
+
+_credentials = CredentialsFile()
+
+
+def gemini_api_key() -> str:
+    path = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
+    if not path:
+        raise CredentialsError("GOOGLE_APPLICATION_CREDENTIALS not set or file missing")
+    api_key = _credentials.get(path).get("api_key")
+    if not api_key:
+        raise CredentialsError("GEMINI API key not found in credentials JSON")
+    return api_key
+
+
+# -------------------------------
+# AZURE SPEECH TOKENS
+# -------------------------------
+class AzureTokenProvider:
+    """Bearer tokens for Azure speech, one cache entry per (region, subscription key)."""
+
+    def __init__(self):
+        self._tokens: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        self._refreshing: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.stats = {"hits": 0, "fetches": 0}
+
+    @staticmethod
+    def _key(region: str, key: str) -> Tuple[str, str]:
+        return region, hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    async def token(self, region: str, key: str) -> str:
+        cache_key = self._key(region, key)
+        cached = self._tokens.get(cache_key)
+        age = time.monotonic() - cached[0] if cached else None
+        if cached and age < AZURE_TOKEN_MAX_AGE:
+            self.stats["hits"] += 1
+            if age >= AZURE_TOKEN_REFRESH_AFTER:
+                self._refresh(cache_key, region, key)  # ahead of expiry, callers keep the current one
+            return cached[1]
+        return await asyncio.shield(self._refresh(cache_key, region, key))
+
+    def invalidate(self, region: str, key: str):
+        """Forget a token the service rejected."""
+        self._tokens.pop(self._key(region, key), None)
+
+    def _refresh(self, cache_key, region, key) -> asyncio.Task:
+        task = self._refreshing.get(cache_key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._fetch(cache_key, region, key))
+            self._refreshing[cache_key] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(cache_key, None))
+            # a failed background refresh is retried by the next caller; don't log it as unretrieved
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    async def _fetch(self, cache_key, region, key) -> str:
+        self.stats["fetches"] += 1
+        started = time.monotonic()
+        resp = await http_clients.request("azure_tts", "POST", AZURE_TOKEN_URL.format(region=region),
+                                          headers={"Ocp-Apim-Subscription-Key": key}, timeout=10)
+        if resp.status_code != 200:
+            raise CredentialsError(f"Token request failed: {resp.status_code}, {resp.text}")
+        self._tokens[cache_key] = (started, resp.text)
+        return resp.text
+
+
+azure_tokens = AzureTokenProvider()
+
+
+def stats() -> Dict:
+    return {"credential_reloads": _credentials.reloads, "azure_tokens": dict(azure_tokens.stats)}
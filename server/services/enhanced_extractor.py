@@ -2,13 +2,17 @@ import os
 import re
 import statistics
 import logging
-from collections import Counter
+import threading
+from collections import Counter, OrderedDict
 from dataclasses import dataclass
 from typing import List, Dict, Tuple, Optional, Set, Any
 
 import fitz
 from fitz import Rect as FitzRect
 
+from services import executor
+from services.result_cache import ResultCache, file_sha256
+
 try:
     from PIL import Image
     import pytesseract
@@ -20,6 +24,11 @@ except ImportError:
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 NUM_PATTERN = re.compile(r"^\s*\d+(\.\d+)*\s*")
+# bump whenever a change alters extract_outline_from_pdf output, it keys the result cache
+EXTRACTOR_VERSION = "2"
+TABLE_CACHE_SIZE = int(os.environ.get("OUTLINE_TABLE_CACHE_SIZE", "1024"))
+# ruled tables need a handful of vector lines/rects; pages with fewer never reach find_tables()
+MIN_TABLE_DRAWING_ITEMS = 4
 
 @dataclass
 class LineObj:
@@ -33,11 +42,35 @@ class LineObj:
 class DocumentProfile:
     doc_type: str
 
+class TableCache:
+    """Size-bounded LRU of table bboxes per (document hash, page), shared by all requests."""
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Tuple[str, int], List[Tuple[float, float, float, float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, int]) -> Optional[List[Tuple[float, float, float, float]]]:
+        with self._lock:
+            if key not in self._data: return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: Tuple[str, int], bboxes: List[Tuple[float, float, float, float]]) -> None:
+        with self._lock:
+            self._data[key] = bboxes
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+TABLE_CACHE = TableCache(TABLE_CACHE_SIZE)
+
 class EnhancedPDFExtractor:
-    def __init__(self):
+    def __init__(self, detect_tables: bool = False):
         self.doc_profile: Optional[DocumentProfile] = None
         self._current_doc: Optional[fitz.Document] = None
-        self.table_cache: Dict[int, Any] = {}
+        self._current_path: Optional[str] = None
+        self._doc_hash: Optional[str] = None
+        self.detect_tables = detect_tables
         self.FORM_KEYWORDS = ['form', 'application', 'declaration', 'proforma']
 
     def classify_document(self, text_sample: str) -> DocumentProfile:
@@ -57,7 +90,15 @@ class EnhancedPDFExtractor:
 
     def get_font_stats(self, page: fitz.Page, bbox: Tuple[float, float, float, float]) -> Tuple[float, bool]:
         try:
-            spans = page.get_text("dict", clip=bbox)['blocks'][0]['lines'][0]['spans']
+            block = page.get_text("dict", clip=bbox)['blocks'][0]
+            return self.block_font_stats(block)
+        except IndexError:
+            return 12.0, False
+
+    def block_font_stats(self, block: Dict[str, Any]) -> Tuple[float, bool]:
+        """Median font size and bold flag of a "dict" block's first line."""
+        try:
+            spans = block['lines'][0]['spans']
             if not spans: return 12.0, False
             sizes = [span['size'] for span in spans]
             is_bold = any((span['flags'] & 1 << 4) for span in spans)
@@ -66,16 +107,19 @@ class EnhancedPDFExtractor:
             return 12.0, False
 
     def collect_lines(self, doc: fitz.Document) -> List[List[LineObj]]:
+        # One "dict" pass per page: block text and font stats come from the same
+        # spans, instead of re-parsing the page with a clip for every block.
         pages_lines: List[List[LineObj]] = []
         for i, page in enumerate(doc):
             lines_this_page: List[LineObj] = []
-            blocks = page.get_text("blocks", sort=True)
+            blocks = page.get_text("dict", sort=True)['blocks']
             for b in blocks:
-                x0, y0, x1, y1, text, _, _ = b
+                if b.get('type', 0) != 0: continue  # image blocks, "blocks" mode never returned them
+                text = "\n".join("".join(span['text'] for span in line['spans']) for line in b['lines'])
                 text = text.strip().replace('\n', ' ')
                 if not text: continue
-                bbox = (x0, y0, x1, y1)
-                font_size, bold = self.get_font_stats(page, bbox)
+                bbox = tuple(b['bbox'])
+                font_size, bold = self.block_font_stats(b)
                 lines_this_page.append(LineObj(page_idx=i, text=text, bbox=bbox, font_size=font_size, bold=bold))
             pages_lines.append(lines_this_page)
         return pages_lines
@@ -129,18 +173,33 @@ class EnhancedPDFExtractor:
             merged_pages.append(final_merged)
         return merged_pages
 
+    def page_may_have_tables(self, page: fitz.Page) -> bool:
+        # cheap pre-filter: find_tables() looks for ruled grids, so a page needs vector line art
+        items = 0
+        for drawing in page.get_drawings():
+            items += len(drawing.get('items', ()))
+            if items >= MIN_TABLE_DRAWING_ITEMS: return True
+        return False
+
+    def page_table_bboxes(self, page_idx: int) -> List[Tuple[float, float, float, float]]:
+        if self._doc_hash is None:
+            self._doc_hash = file_sha256(self._current_path)
+        key = (self._doc_hash, page_idx)
+        bboxes = TABLE_CACHE.get(key)
+        if bboxes is None:
+            page = self._current_doc[page_idx]
+            bboxes = []
+            if self.page_may_have_tables(page):
+                tables = getattr(page, "find_tables", lambda: [])()
+                bboxes = [tuple(table.bbox) for table in tables]
+            TABLE_CACHE.put(key, bboxes)
+        return bboxes
+
     def is_part_of_dense_layout(self, line: LineObj, all_lines: List[LineObj]) -> bool:
-        text = line.text.lower().strip()
         if self._current_doc:
             try:
-                page = self._current_doc[line.page_idx]
-                if line.page_idx in self.table_cache:
-                    tables = self.table_cache[line.page_idx]
-                else:
-                    tables = getattr(page, "find_tables", lambda: [])()
-                    self.table_cache[line.page_idx] = tables
-                for table in tables:
-                    if FitzRect(line.bbox).intersects(table.bbox):
+                for bbox in self.page_table_bboxes(line.page_idx):
+                    if FitzRect(line.bbox).intersects(bbox):
                         return True
             except Exception:
                 pass
@@ -193,11 +252,13 @@ class EnhancedPDFExtractor:
             outline.append({"level": level, "text": c.text, "page": c.page_idx + 1})
         return outline
 
-    def extract_outline_from_pdf(self, pdf_path: str) -> Dict:
+    def extract_outline_from_pdf(self, pdf_path: str, raise_errors: bool = False, digest: Optional[str] = None) -> Dict:
         try:
-            self.table_cache.clear()
             doc = fitz.open(pdf_path)
             self._current_doc = doc
+            self._current_path = pdf_path
+            # callers that already hashed the file pass the digest; table lookups hash it lazily otherwise
+            self._doc_hash = digest
             self.doc_profile = self.classify_document(doc[0].get_text() if len(doc) else "")
             all_lines = self.collect_lines(doc)
             page_sizes = {i: (p.rect.width, p.rect.height) for i, p in enumerate(doc)}
@@ -205,14 +266,42 @@ class EnhancedPDFExtractor:
             filtered_lines = [[ln for j, ln in enumerate(lines) if (i, j) not in drop_mask] for i, lines in enumerate(all_lines)]
             merged_pages = self.merge_multiline_headings(filtered_lines)
             candidates = self.pick_candidates(merged_pages)
+            if self.detect_tables:
+                # only pages that hold candidates ever get table analysis
+                candidates = [c for c in candidates if not self.is_part_of_dense_layout(c, merged_pages[c.page_idx])]
             title = self.extract_title(doc, candidates, all_lines)
             outline = self.assign_levels(title, candidates)
             doc.close()
             return {"title": title or "", "outline": outline}
         except Exception as e:
             logging.error(f"Error processing {pdf_path}: {e}")
+            if raise_errors:
+                raise
             return {"title": "", "outline": []}
 
-def extract_outline_from_pdf(pdf_path: str) -> Dict:
-    extractor = EnhancedPDFExtractor()
-    return extractor.extract_outline_from_pdf(pdf_path)
+def extract_outline_from_pdf(pdf_path: str, detect_tables: bool = False, raise_errors: bool = False,
+                             digest: Optional[str] = None) -> Dict:
+    extractor = EnhancedPDFExtractor(detect_tables=detect_tables)
+    return extractor.extract_outline_from_pdf(pdf_path, raise_errors, digest)
+
+OUTLINE_CACHE = ResultCache("outline", EXTRACTOR_VERSION)
+
+def cached_extract_outline(pdf_path: str, detect_tables: bool = False, runner=None) -> Dict:
+    """
+    extract_outline_from_pdf, memoised on the file's content hash.
+    runner(fn, *args), e.g. executor.offload(...), decides where a cache miss is computed.
+    A failed extraction returns the empty outline without caching it, so the next call retries.
+    """
+    runner = runner or (lambda fn, *args: fn(*args))
+    try:
+        # hashed here once: the hash memo is per process, a cpu worker would read the whole file again
+        digest = file_sha256(pdf_path)
+        return OUTLINE_CACHE.cached(
+            pdf_path,
+            lambda: runner(extract_outline_from_pdf, pdf_path, detect_tables, True, digest),
+            variant="" if detect_tables else "-notables",
+        )
+    except executor.Overloaded:
+        raise
+    except Exception:
+        return {"title": "", "outline": []}
@@ -0,0 +1,165 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+IO_WORKERS = int(os.environ.get("EXEC_IO_WORKERS", "8"))
+CPU_WORKERS = int(os.environ.get("EXEC_CPU_WORKERS", os.cpu_count() or 1))
+# queued + running jobs per pool before new requests get a 429
+IO_MAX_INFLIGHT = int(os.environ.get("EXEC_IO_MAX_INFLIGHT", "64"))
+CPU_MAX_INFLIGHT = int(os.environ.get("EXEC_CPU_MAX_INFLIGHT", "32"))
+
+
+class Overloaded(Exception):
+    """A pool is at its in-flight limit; surfaced to clients as 429."""
+
+    def __init__(self, pool: str, op: str):
+        super().__init__(f"{pool} pool is busy, rejected '{op}'")
+        self.pool = pool
+        self.op = op
+
+
+def _timed_call(fn, args, kwargs):
+    # runs in the worker (thread or process); wall clock is comparable across processes
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return started, time.time(), result
+
+
+class _OpStats:
+    def __init__(self):
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        done = self.completed + self.failed
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "queue_wait_ms_avg": round(self.wait_total / done * 1000, 2) if done else None,
+            "queue_wait_ms_max": round(self.wait_max * 1000, 2),
+            "run_ms_avg": round(self.run_total / done * 1000, 2) if done else None,
+        }
+
+
+class BoundedExecutor:
+    """
+    A lazily created thread or process pool with a cap on queued + running jobs
+    and per-operation queue-wait / run-time statistics.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any], max_inflight: int):
+        self.name = name
+        self.max_inflight = max_inflight
+        self._factory = factory
+        self._pool = None
+        self._inflight = 0
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _OpStats] = defaultdict(_OpStats)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = self._factory()
+            return self._pool
+
+    def submit(self, op: str, fn: Callable, *args, **kwargs) -> Future:
+        """Queue fn(*args, **kwargs); raises Overloaded instead of queueing past the limit."""
+        with self._lock:
+            if self._inflight >= self.max_inflight:
+                self._stats[op].rejected += 1
+                raise Overloaded(self.name, op)
+            self._inflight += 1
+        pool = self._get_pool()
+        submitted = time.time()
+        outer: Future = Future()
+
+        def done(inner: Future):
+            error = inner.exception()
+            with self._lock:
+                self._inflight -= 1
+                stats = self._stats[op]
+                if error is not None:
+                    stats.failed += 1
+                    stats.wait_total += time.time() - submitted
+                else:
+                    started, finished, result = inner.result()
+                    wait = max(0.0, started - submitted)
+                    stats.completed += 1
+                    stats.wait_total += wait
+                    stats.wait_max = max(stats.wait_max, wait)
+                    stats.run_total += finished - started
+            if error is not None:
+                outer.set_exception(error)
+            else:
+                outer.set_result(result)
+
+        try:
+            pool.submit(_timed_call, fn, args, kwargs).add_done_callback(done)
+        except Exception:
+            with self._lock:
+                self._inflight -= 1
+            raise
+        return outer
+
+    async def run(self, op: str, fn: Callable, *args, **kwargs):
+        """Await fn in the pool without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(op, fn, *args, **kwargs))
+
+    def call(self, op: str, fn: Callable, *args, **kwargs):
+        """Blocking variant for code that already runs in a worker thread."""
+        return self.submit(op, fn, *args, **kwargs).result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "inflight": self._inflight,
+                "max_inflight": self.max_inflight,
+                "ops": {op: s.summary() for op, s in self._stats.items()},
+            }
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# I/O-ish work and work that releases the GIL (file writes, hashing, index sync,
+# torch encoding + FAISS search) runs on threads.
+io = BoundedExecutor("io", lambda: ThreadPoolExecutor(IO_WORKERS, thread_name_prefix="io"), IO_MAX_INFLIGHT)
+
+# PyMuPDF holds the GIL, so PDF extraction gets real processes. "spawn" keeps
+# workers clear of the parent's threads (torch, uvicorn) that fork would copy.
+cpu = BoundedExecutor(
+    "cpu",
+    lambda: ProcessPoolExecutor(CPU_WORKERS, mp_context=multiprocessing.get_context("spawn")),
+    CPU_MAX_INFLIGHT,
+)
+
+
+def offload(op: str) -> Callable:
+    """runner(fn, *args) that executes fn in the process pool and waits; for use inside io jobs."""
+    return partial(cpu.call, op)
+
+
+def all_stats() -> Dict[str, Any]:
+    return {"io": io.stats(), "cpu": cpu.stats()}
+
+
+def shutdown():
+    io.shutdown()
+    cpu.shutdown()
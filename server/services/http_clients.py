@@ -0,0 +1,128 @@
+"""
+Shared async HTTP clients for upstream APIs, one per upstream, so every call
+reuses pooled keep-alive (HTTP/2 where the h2 package is installed)
+connections instead of paying DNS + TCP + TLS again.
+
+Clients are created on first use and closed by the app lifespan (aclose()).
+Base URLs come from the environment, so a local mock server can stand in
+for any upstream, e.g. GEMINI_API_BASE=http://127.0.0.1:9000.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import importlib.util
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HTTP2 = importlib.util.find_spec("h2") is not None
+MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+# retries: full-jitter exponential backoff, or the upstream's Retry-After when it sends one
+MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "2"))
+BACKOFF_BASE = float(os.environ.get("HTTP_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.environ.get("HTTP_BACKOFF_MAX", "8"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@dataclass(frozen=True)
+class Upstream:
+    base_url: str = ""
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+
+
+UPSTREAMS: Dict[str, Upstream] = {
+    "gemini": Upstream(
+        base_url=os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com"),
+        read_timeout=float(os.environ.get("GEMINI_TIMEOUT", "30")),
+    ),
+    # token and speech endpoints live on per-region hosts, so requests pass full URLs
+    "azure_tts": Upstream(read_timeout=float(os.environ.get("AZURE_TTS_TIMEOUT", "30"))),
+}
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+if not HTTP2:
+    logger.info("h2 not installed, upstream clients use HTTP/1.1 keep-alive")
+
+
+def client(name: str) -> httpx.AsyncClient:
+    """The shared client for upstream name, created on first use."""
+    existing = _clients.get(name)
+    if existing is not None and not existing.is_closed:
+        return existing
+    upstream = UPSTREAMS[name]
+    _clients[name] = httpx.AsyncClient(
+        base_url=upstream.base_url,
+        http2=HTTP2,
+        timeout=httpx.Timeout(upstream.read_timeout, connect=upstream.connect_timeout),
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE,
+                            keepalive_expiry=KEEPALIVE_EXPIRY),
+    )
+    return _clients[name]
+
+
+async def aclose():
+    clients = list(_clients.values())
+    _clients.clear()
+    for c in clients:
+        await c.aclose()
+
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), None when absent or malformed."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt: int) -> float:
+    """Full jitter: uniform in [0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt)]."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+async def request(name: str, method: str, url: str, retries: Optional[int] = None, **kwargs) -> httpx.Response:
+    """
+    Send a request through the shared client of upstream name, retrying
+    connection errors, timeouts and 429/5xx answers. Returns the last response
+    (callers still raise_for_status); raises the last transport error when
+    every attempt failed without one. A Retry-After longer than BACKOFF_MAX
+    is not waited out, that response is returned as is.
+    """
+    retries = MAX_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        try:
+            response = await client(name).request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            if attempt == retries:
+                raise
+            delay = backoff(attempt)
+            logger.warning(f"{name}: {type(e).__name__} on attempt {attempt + 1}, retrying in {delay:.2f}s")
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            delay = retry_after(response)
+            if delay is None:
+                delay = backoff(attempt)
+            elif delay > BACKOFF_MAX:
+                return response
+            logger.warning(f"{name}: HTTP {response.status_code} on attempt {attempt + 1}, retrying in {delay:.2f}s")
+            await response.aclose()
+        await asyncio.sleep(delay)
@@ -0,0 +1,113 @@
+"""
+Response cache for LLM calls, keyed by (model, normalised prompt).
+
+Entries live in an LRU with a TTL. Concurrent requests for the same key share
+one upstream call instead of each sending their own. With LLM_SEMANTIC_CACHE=1,
+a miss may also be served by a cached response whose prompt embeds (with the
+search model) within LLM_SEMANTIC_THRESHOLD cosine similarity of this one.
+"""
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from services import executor
+from services.result_cache import LRUCache
+from backends.relevant_model import model_registry, relevant_utilis
+
+logger = logging.getLogger(__name__)
+
+CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", "256"))
+CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", "600"))
+SEMANTIC = os.environ.get("LLM_SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_THRESHOLD = float(os.environ.get("LLM_SEMANTIC_THRESHOLD", "0.97"))
+
+Key = Tuple[str, str]
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace; prompts that differ only in spacing or padding share an entry."""
+    return " ".join(prompt.split())
+
+
+class ResponseCache:
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL, semantic: bool = SEMANTIC,
+                 threshold: float = SEMANTIC_THRESHOLD):
+        self.responses = LRUCache(maxsize, ttl=ttl)
+        self.semantic = semantic
+        self.threshold = threshold
+        # key -> prompt embedding, for the semantic lookup; bounded like the responses
+        self._embeddings: "OrderedDict[Key, np.ndarray]" = OrderedDict()
+        self._inflight: Dict[Key, asyncio.Task] = {}
+        self.stats = {"coalesced": 0, "semantic_hits": 0, "upstream_calls": 0}
+
+    async def get_or_fetch(self, model: str, prompt: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Cached response for (model, prompt), else the result of fetch(). One fetch
+        runs per key at a time; failures are passed to every waiter and not cached.
+        """
+        key = (model, normalize_prompt(prompt))
+        cached = self.responses.get(key)
+        if cached is not None:
+            return cached
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.get_running_loop().create_task(self._fetch(key, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # a waiter that goes away must not cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: Key, fetch):
+        embedding = await self._embed(key[1]) if self.semantic else None
+        if embedding is not None:
+            similar = self._nearest(key[0], embedding)
+            if similar is not None:
+                self.stats["semantic_hits"] += 1
+                self.responses.put(key, similar)  # exact repeats of this prompt skip the embedding
+                return similar
+
+        self.stats["upstream_calls"] += 1
+        response = await fetch()
+        self.responses.put(key, response)
+        if embedding is not None:
+            self._embeddings[key] = embedding
+            self._embeddings.move_to_end(key)
+            while len(self._embeddings) > self.responses.maxsize:
+                self._embeddings.popitem(last=False)
+        return response
+
+    async def _embed(self, prompt: str) -> Optional[np.ndarray]:
+        # never hold an LLM call up while the search model is still loading
+        if not model_registry.is_ready():
+            return None
+        try:
+            return (await executor.io.run("llm_cache_embed", relevant_utilis.embed_texts, [prompt]))[0]
+        except executor.Overloaded:
+            return None
+
+    def _nearest(self, model: str, embedding: np.ndarray) -> Optional[Any]:
+        keys = [k for k in self._embeddings if k[0] == model]
+        if not keys:
+            return None
+        sims = np.stack([self._embeddings[k] for k in keys]) @ embedding
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+        response = self.responses.get(keys[best])
+        if response is None:  # expired or evicted since
+            self._embeddings.pop(keys[best], None)
+        return response
+
+    def summary(self) -> Dict[str, Any]:
+        return {**self.responses.summary(), **self.stats, "semantic": self.semantic,
+                "semantic_threshold": self.threshold if self.semantic else None}
+
+
+responses = ResponseCache()
@@ -1,8 +1,50 @@
+from typing import List, Optional, Tuple
+
 import fitz  # PyMuPDF
+from services.result_cache import ResultCache
+
+# bump whenever extract_text_from_pdf output changes, it keys the result cache
+TEXT_EXTRACTOR_VERSION = "1"
+TEXT_CACHE = ResultCache("text", TEXT_EXTRACTOR_VERSION)
+
+
+def page_count(path: str) -> int:
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def parse_page_range(pages: str, total: int) -> Tuple[int, int]:
+    """
+    Turn a 1-based inclusive range ("10-20", "7", "10-", "-20") into 0-based
+    (first, end) page indexes clamped to total. Raises ValueError when malformed or empty.
+    """
+    start, sep, stop = pages.strip().partition("-")
+    try:
+        first = int(start) if start else 1
+        last = (int(stop) if stop else total) if sep else first
+    except ValueError:
+        raise ValueError(f"Invalid page range '{pages}', expected e.g. 10-20")
+    if first < 1 or last < first or first > total:
+        raise ValueError(f"Page range '{pages}' is outside 1-{total}")
+    return first - 1, min(last, total)
+
+
+def extract_pages_text(path: str, first: int = 0, end: Optional[int] = None) -> List[str]:
+    """Text of pages [first, end), one string per page."""
+    with fitz.open(path) as doc:
+        end = doc.page_count if end is None else min(end, doc.page_count)
+        return [doc[i].get_text() for i in range(first, end)]
+
 
 def extract_text_from_pdf(path: str) -> str:
-    extracted_text = ""
-    doc = fitz.open(path)
-    for page in doc:
-        extracted_text += page.get_text()
-    return extracted_text.strip()
+    # one join instead of repeated += keeps large documents linear
+    return "".join(extract_pages_text(path)).strip()
+
+
+def cached_extract_text(path: str, runner=None) -> str:
+    """
+    extract_text_from_pdf, memoised on the file's content hash.
+    runner(fn, *args), e.g. executor.offload(...), decides where a cache miss is computed.
+    """
+    runner = runner or (lambda fn, *args: fn(*args))
+    return TEXT_CACHE.cached(path, lambda: runner(extract_text_from_pdf, path))
@@ -1,6 +1,12 @@
 import os
-from backends.relevant_model import relevant_utilis
+import shutil
+import threading
+import logging
+import numpy as np
+from backends.relevant_model import relevant_utilis, index_store, chunk_store, index_factory, pipeline
+from services import blob_store, result_cache
 
+logger = logging.getLogger(__name__)
 
 # uploads is sibling folder, not inside relevant_model
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "..", "uploads")
@@ -9,25 +15,294 @@ UPLOAD_DIR = os.path.abspath(UPLOAD_DIR)
 INDEX_DIR = os.path.join(os.path.dirname(__file__), "..", "storage", "index_data")
 INDEX_DIR = os.path.abspath(INDEX_DIR)
 
+# serialises every writer of the index (upload sync, deletes, rebuilds)
+_index_lock = threading.Lock()
+# searches read from this resident copy; writers publish a new version and swap it
+_holder = index_store.IndexHolder(INDEX_DIR)
+# documents done / chunks embedded / ETA of the running indexing job
+progress = pipeline.Progress()
+
+# 2: documents are keyed by content hash, filenames are aliases of them
+MANIFEST_VERSION = 2
+
+RESULT_CACHE_SIZE = int(os.environ.get("RELEVANT_RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL = float(os.environ.get("RELEVANT_RESULT_CACHE_TTL", "600"))
+# (index version, normalised query, k, context, mode) -> results before alias resolution
+_results = result_cache.LRUCache(RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+_results_version = None
+
+
+def _empty_manifest():
+    # files: filename -> {size, mtime, sha256}; docs: sha256 -> {start, end} row range.
+    # Files with identical content share one docs entry, so each distinct PDF is embedded once.
+    return {"version": MANIFEST_VERSION, "next_id": 0, "files": {}, "docs": {}}
+
+
+def _load_state():
+    """
+    Return (index, store, manifest) for incremental updates,
+    or None when there is no index yet or its manifest predates MANIFEST_VERSION.
+    """
+    version_dir = index_store.current_dir(INDEX_DIR)
+    manifest = relevant_utilis.load_manifest(version_dir) if version_dir is not None else None
+    if manifest is None or manifest.get("version") != MANIFEST_VERSION:
+        return None
+    # a private copy of the index: the live snapshot is never mutated under in-flight searches
+    index = relevant_utilis.load_index(version_dir)
+    return index, chunk_store.open_store(version_dir), manifest
+
+
+def _publish(index, manifest, version, version_dir):
+    """Save index + manifest next to the already written chunk store, then swap the version in."""
+    relevant_utilis.save_index(index, version_dir, manifest)
+    index_store.publish_version(INDEX_DIR, version)
+    _holder.refresh()
+
+
+def _sync_files(manifest, on_disk):
+    """
+    Bring manifest["files"] in line with the PDFs in on_disk, hashing only files
+    whose size or mtime moved. Returns True when any entry changed.
+    """
+    files = manifest["files"]
+    changed = False
+    for fname in [f for f in files if f not in on_disk]:
+        del files[fname]
+        changed = True
+    for fname in sorted(on_disk):
+        path = os.path.join(UPLOAD_DIR, fname)
+        entry = files.get(fname)
+        quick = relevant_utilis.file_fingerprint(path, with_hash=False)
+        if entry and entry["size"] == quick["size"] and entry["mtime"] == quick["mtime"]:
+            continue
+        files[fname] = relevant_utilis.file_fingerprint(path)
+        changed = True
+    return changed
+
+
+def _unindexed(manifest):
+    """
+    (path, sha256) of every distinct content in manifest["files"] without rows yet,
+    read through its alphabetically first filename.
+    """
+    pending = {}
+    for fname in sorted(manifest["files"]):
+        digest = manifest["files"][fname]["sha256"]
+        if digest not in manifest["docs"] and digest not in pending:
+            pending[digest] = os.path.join(UPLOAD_DIR, fname)
+    return [(path, digest) for digest, path in pending.items()]
+
+
+def _unreferenced(manifest):
+    """Indexed contents that no filename points to any more."""
+    wanted = {fp["sha256"] for fp in manifest["files"].values()}
+    return [digest for digest in manifest["docs"] if digest not in wanted]
+
+
+def _stream_docs(writer, manifest, docs, index=None):
+    """
+    Run docs ((path, sha256) pairs) through the streaming extract -> embed -> write
+    pipeline and record each document's id range in the manifest. Returns the number of rows added.
+    """
+    next_row = manifest["next_id"]
+    ranges = pipeline.stream_into(writer, docs, index, progress)
+    for _, digest in docs:
+        start, end = ranges.get(digest, (next_row, next_row))
+        manifest["docs"][digest] = {"start": start, "end": end}
+    manifest["next_id"] = len(writer)
+    return len(writer) - next_row
+
+
+def _remove_doc(index, manifest, digest):
+    """
+    Drop one document's vectors; its chunk rows become tombstones on publish.
+    HNSW cannot remove vectors, there the tombstones alone hide them until a rebuild.
+    """
+    entry = manifest["docs"].pop(digest)
+    ids = np.arange(entry["start"], entry["end"], dtype="int64")
+    if len(ids) and index_factory.supports_remove(index):
+        index.remove_ids(ids)
+    return len(ids)
+
+
+def _discard_version(writer, version, version_dir):
+    """Close the files of a failed build and remove its version dir, unless it already went live."""
+    if writer is not None:
+        writer.abort()
+    if version_dir is not None and version != index_store.current_version(INDEX_DIR):
+        shutil.rmtree(version_dir, ignore_errors=True)
+
+
+def rebuild_index():
+    """
+    Full re-index of every distinct PDF in uploads. Maintenance operation: compacts
+    ids and the chunk store, everything else should go through index_pdfs().
+    Paragraphs and vectors stream to disk first; the index is then trained and
+    filled from the memory-mapped vectors in batches.
+    """
+    with _index_lock:
+        return _rebuild_locked()
+
+
+def _rebuild_locked():
+    """Body of rebuild_index(); the caller holds _index_lock."""
+    manifest = _empty_manifest()
+    _sync_files(manifest, set(relevant_utilis.list_pdfs(UPLOAD_DIR)))
+    docs = _unindexed(manifest)
+
+    progress.start(len(docs))
+    writer = version = version_dir = None
+    try:
+        version, version_dir = index_store.prepare_version(INDEX_DIR)
+        writer = chunk_store.ChunkStoreWriter(version_dir)
+        added = _stream_docs(writer, manifest, docs)
+        writer.close()
+        writer = None
+        if not added:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            progress.finish()
+            return {"message": "No PDFs found in uploads"}
+
+        store = chunk_store.open_store(version_dir)
+        index = index_factory.build_index(store.vectors)
+        _publish(index, manifest, version, version_dir)
+        progress.finish()
+    except Exception:
+        _discard_version(writer, version, version_dir)
+        progress.finish("failed")
+        raise
+
+    return {"message": f"Indexed {added} paragraphs from PDFs"}
+
 
 def index_pdfs():
-    """Index all PDFs in uploads folder."""
-    corpus = relevant_utilis.create_corpus_from_folder(UPLOAD_DIR)
-    if not corpus:
-        return {"message": "No PDFs found in uploads"}
-
-    embeddings, model = relevant_utilis.build_embeddings(corpus)
-    metadata = [
-        {"doc_id": c["doc_id"], "page": c["page"], "text": c["text"], "chunk_id": c["chunk_id"]}
-        for c in corpus
-    ]
-    relevant_utilis.build_faiss_index(embeddings, INDEX_DIR, metadata)
-
-    return {"message": f"Indexed {len(corpus)} paragraphs from PDFs"}
-
-
-def query_pdfs(query: str, k: int = 5, context: int = 0):
-    """Search PDFs for relevant paragraphs."""
-    index, metadata = relevant_utilis.load_index_and_meta(INDEX_DIR)
-    results = relevant_utilis.query_index_with_context(query, index, metadata, k=k, context_paras=context)
-    return results
+    """
+    Bring the index in line with uploads: embed only content not indexed yet
+    and drop the vectors of content no filename refers to any more. Renamed and
+    duplicate files are never embedded again.
+    """
+    with _index_lock:
+        state = _load_state()
+        if state is None:
+            return _rebuild_locked()
+        index, store, manifest = state
+        added = 0
+        touched = _sync_files(manifest, set(relevant_utilis.list_pdfs(UPLOAD_DIR)))
+        dropped = _unreferenced(manifest)
+        removed = sum(_remove_doc(index, manifest, digest) for digest in dropped)
+        docs = _unindexed(manifest)
+        changed_docs = [os.path.basename(path) for path, _ in docs]
+
+        if dropped or touched or docs:
+            progress.start(len(docs))
+            writer = version = version_dir = None
+            try:
+                version, version_dir = index_store.prepare_version(INDEX_DIR)
+                writer = chunk_store.ChunkStoreWriter(version_dir)
+                writer.copy_from(store, dropped)
+                added = _stream_docs(writer, manifest, docs, index)
+                writer.close()
+                writer = None
+                if added:
+                    index_factory.rebuild_hint(index)
+                _publish(index, manifest, version, version_dir)
+                progress.finish()
+            except Exception:
+                _discard_version(writer, version, version_dir)
+                progress.finish("failed")
+                raise
+
+    logger.info(f"Incremental index: +{added} / -{removed} paragraphs ({len(changed_docs)} docs changed)")
+    return {
+        "message": f"Indexed {added} paragraphs from {len(changed_docs)} new or changed PDFs, removed {removed}",
+        "added": added,
+        "removed": removed,
+        "documents": changed_docs,
+    }
+
+
+def remove_pdfs(filenames=None):
+    """
+    Forget the given PDFs (all PDFs when filenames is None) without touching the rest.
+    Vectors are dropped only for content no remaining filename shares.
+    """
+    with _index_lock:
+        state = _load_state()
+        if state is None:
+            return {"removed": 0}
+        index, store, manifest = state
+        files = manifest["files"]
+        targets = list(files) if filenames is None else [f for f in filenames if f in files]
+        for fname in targets:
+            del files[fname]
+        dropped = _unreferenced(manifest)
+        removed = sum(_remove_doc(index, manifest, digest) for digest in dropped)
+        if targets:
+            writer = version = version_dir = None
+            try:
+                version, version_dir = index_store.prepare_version(INDEX_DIR)
+                writer = chunk_store.ChunkStoreWriter(version_dir)
+                writer.copy_from(store, dropped)
+                writer.close()
+                writer = None
+                _publish(index, manifest, version, version_dir)
+            except Exception:
+                _discard_version(writer, version, version_dir)
+                raise
+    return {"removed": removed}
+
+
+def query_pdfs(query: str, k: int = 5, context: int = 0, mode: str = None):
+    """
+    Search PDFs for relevant paragraphs. Hits are indexed per content hash;
+    each is reported under its first filename with every filename in "aliases".
+    mode: "dense", "lexical" or "hybrid" (see relevant_utilis.search_many).
+    """
+    return query_pdfs_batch([query], k=k, context=context, mode=mode)[0]
+
+
+def query_pdfs_batch(queries, k: int = 5, context: int = 0, mode: str = None):
+    """
+    query_pdfs for many queries at once: one encoder pass and one index search
+    for the queries not answered from the result cache.
+    """
+    global _results_version
+    snapshot = _holder.snapshot()
+    if snapshot is None:
+        raise FileNotFoundError("Index not found in " + INDEX_DIR)
+    if _results_version != snapshot.version:
+        # a new index version was published: every cached result is stale
+        _results.pop_where(lambda key: key[0] != snapshot.version)
+        _results_version = snapshot.version
+
+    mode = mode or relevant_utilis.SEARCH_MODE
+    keys = [(snapshot.version, relevant_utilis.normalize_query(q), k, context, mode) for q in queries]
+    batches = [_results.get(key) for key in keys]
+    missing = [i for i, results in enumerate(batches) if results is None]
+    if missing:
+        found = relevant_utilis.search_many(
+            [queries[i] for i in missing], snapshot.index, snapshot.store, k=k, context_paras=context, mode=mode
+        )
+        for i, results in zip(missing, found):
+            batches[i] = results
+            _results.put(keys[i], results)
+    logger.info(f"Searched {len(queries)} queries ({mode}, k={k}, context={context}, "
+                f"{len(queries) - len(missing)} cached)")
+    return [_resolve_aliases(results) for results in batches]
+
+
+def cache_stats():
+    return {"query_embeddings": relevant_utilis.query_embedding_cache.summary(), "results": _results.summary()}
+
+
+def _resolve_aliases(results):
+    by_digest = blob_store.aliases_by_digest(UPLOAD_DIR)
+    resolved = []
+    for result in results:
+        names = by_digest.get(result["doc_id"])
+        if not names and os.path.exists(os.path.join(UPLOAD_DIR, result["doc_id"])):
+            names = [result["doc_id"]]  # index built before content hashing, until the next sync
+        if not names:
+            continue  # file deleted, index not synced yet
+        resolved.append({**result, "doc_id": names[0], "aliases": names})
+    return resolved
@@ -0,0 +1,290 @@
+import os
+import json
+import hashlib
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "storage", "cache")
+CACHE_DIR = os.path.abspath(CACHE_DIR)
+MEMORY_ITEMS = int(os.environ.get("RESULT_CACHE_MEMORY_ITEMS", "128"))
+
+# every ResultCache / DiskCache by name, for stats and file invalidation
+CACHES: Dict[str, Any] = {}
+
+
+class LRUCache:
+    """Small thread-safe in-memory LRU; entries older than ttl seconds (if set) count as misses."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (self.ttl is not None and time.monotonic() - entry[0] > self.ttl):
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def pop_where(self, predicate: Callable[[Any], bool]):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def summary(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"items": len(self), "maxsize": self.maxsize, "ttl_s": self.ttl, "hits": self.hits,
+                "misses": self.misses, "hit_rate": round(self.hits / lookups, 3) if lookups else None}
+
+
+# -------------------------------
+# FILE CONTENT HASHES
+# -------------------------------
+# (path, size, mtime_ns) -> sha256, so unchanged files are not re-read on every request
+_hash_memo = LRUCache(4096)
+
+
+def _file_key(path) -> Tuple[str, int, int]:
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+
+def file_sha256(path) -> str:
+    key = _file_key(path)
+    digest = _hash_memo.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        _hash_memo.put(key, digest)
+    return digest
+
+
+def remember_sha256(path, digest: str):
+    """Record a hash computed elsewhere (e.g. while streaming an upload) for path's current content."""
+    _hash_memo.put(_file_key(path), digest)
+
+
+def invalidate_file(path):
+    """
+    Forget every cached result for the current content of path.
+    Call before a file is overwritten or deleted.
+    """
+    if not os.path.exists(path):
+        return
+    digest = file_sha256(path)
+    for cache in CACHES.values():
+        cache.invalidate(digest)
+    abspath = os.path.abspath(path)
+    _hash_memo.pop_where(lambda key: key[0] == abspath)
+
+
+# -------------------------------
+# RESULT CACHE
+# -------------------------------
+class ResultCache:
+    """
+    JSON results keyed by (content hash, variant), persisted under
+    storage/cache/<name>/<version>/ with an in-memory LRU in front.
+    Bumping version (the extractor version) orphans all older entries.
+    """
+
+    def __init__(self, name: str, version: str, memory_items: int = MEMORY_ITEMS):
+        self.name = name
+        self.version = version
+        self.dir = os.path.join(CACHE_DIR, name, version)
+        self._memory = LRUCache(memory_items)
+        self._stats_lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        CACHES[name] = self
+
+    def _path(self, digest, variant):
+        return os.path.join(self.dir, digest[:2], f"{digest}{variant}.json")
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def get(self, digest: str, variant: str = "") -> Optional[Any]:
+        value = self._memory.get((digest, variant))
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        path = self._path(digest, variant)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._count("misses")
+            return None
+        self._memory.put((digest, variant), value)
+        self._count("disk_hits")
+        return value
+
+    def put(self, digest: str, value: Any, variant: str = ""):
+        self._memory.put((digest, variant), value)
+        path = self._path(digest, variant)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def invalidate(self, digest: str):
+        self._memory.pop_where(lambda key: key[0] == digest)
+        folder = os.path.join(self.dir, digest[:2])
+        if os.path.isdir(folder):
+            for fname in os.listdir(folder):
+                if fname.startswith(digest):
+                    os.remove(os.path.join(folder, fname))
+
+    def cached(self, path: str, compute: Callable[[], Any], variant: str = "") -> Any:
+        """Return the cached result for path's content, computing and storing it on a miss."""
+        digest = file_sha256(path)
+        value = self.get(digest, variant)
+        if value is None:
+            value = compute()
+            self.put(digest, value, variant)
+        return value
+
+    def summary(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = sum(stats.values())
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        return {"version": self.version, **stats, "hit_rate": round(hits / lookups, 3) if lookups else None,
+                "memory_items": len(self._memory)}
+
+
+# -------------------------------
+# SIZE-BOUNDED DISK CACHE
+# -------------------------------
+class DiskCache:
+    """
+    Opaque blobs keyed by a hex digest under storage/cache/<name>/, evicted
+    least-recently-used first once they take more than max_bytes. Last use
+    is the file's mtime (touched on every hit), so recency survives restarts.
+    """
+
+    def __init__(self, name: str, max_bytes: int, suffix: str = ""):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.dir = os.path.join(CACHE_DIR, name)
+        self._lock = threading.Lock()
+        self._index: Optional["OrderedDict[str, int]"] = None  # key -> size, least recent first
+        self._bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        CACHES[name] = self
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.dir, key[:2], f"{key}{self.suffix}")
+
+    def _load(self):
+        if self._index is not None:
+            return
+        entries = []
+        for dirpath, _, fnames in os.walk(self.dir):
+            for fname in fnames:
+                if fname.endswith(".tmp"):
+                    continue
+                st = os.stat(os.path.join(dirpath, fname))
+                entries.append((st.st_mtime, fname[:len(fname) - len(self.suffix)] if self.suffix else fname, st.st_size))
+        self._index = OrderedDict((key, size) for _, key, size in sorted(entries))
+        self._bytes = sum(self._index.values())
+
+    def get_path(self, key: str) -> Optional[str]:
+        """Path of the cached blob (marked as just used), or None on a miss."""
+        path = self.path(key)
+        with self._lock:
+            self._load()
+            if key in self._index and os.path.exists(path):
+                os.utime(path)
+                self._index.move_to_end(key)
+                self.stats["hits"] += 1
+                return path
+            self.stats["misses"] += 1
+            return None
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, data: bytes):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._load()
+            self._bytes += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            # never evict the entry just written, even when it alone exceeds the bound
+            while self._bytes > self.max_bytes and len(self._index) > 1:
+                old, size = self._index.popitem(last=False)
+                self._bytes -= size
+                self.stats["evictions"] += 1
+                try:
+                    os.remove(self.path(old))
+                except FileNotFoundError:
+                    pass
+
+    def invalidate(self, digest: str):
+        with self._lock:
+            self._load()
+            if digest in self._index:
+                self._bytes -= self._index.pop(digest)
+                try:
+                    os.remove(self.path(digest))
+                except FileNotFoundError:
+                    pass
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            self._load()
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {**self.stats, "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else None,
+                    "items": len(self._index), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+def all_stats() -> Dict[str, Any]:
+    return {name: cache.summary() for name, cache in CACHES.items()}
@@ -0,0 +1,83 @@
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+from services import executor, relevant_service
+
+logger = logging.getLogger(__name__)
+
+# how long a lone search waits for company, and the most queries merged into one pass
+WINDOW_MS = float(os.environ.get("RELEVANT_SEARCH_BATCH_WINDOW_MS", "5"))
+MAX_BATCH = int(os.environ.get("RELEVANT_SEARCH_MAX_BATCH", "64"))
+
+
+class MicroBatcher:
+    """
+    Coalesces single items that arrive within window_ms of each other (and share
+    a key) into one call of run_batch(key, items), which must return one result
+    per item in order. Lives on the event loop; no locking needed.
+    """
+
+    def __init__(self, run_batch: Callable[[Hashable, List[Any]], Awaitable[List[Any]]],
+                 window_ms: float = WINDOW_MS, max_batch: int = MAX_BATCH):
+        self.run_batch = run_batch
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending: Dict[Hashable, List[Tuple[Any, asyncio.Future]]] = {}
+        self._tasks = set()  # strong references, the loop only keeps weak ones
+        self.stats = {"items": 0, "batches": 0}
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def submit(self, key: Hashable, item: Any):
+        if self.window <= 0:
+            self.stats["items"] += 1
+            self.stats["batches"] += 1
+            return (await self.run_batch(key, [item]))[0]
+
+        future = asyncio.get_running_loop().create_future()
+        group = self._pending.setdefault(key, [])
+        group.append((item, future))
+        if len(group) == 1:
+            self._spawn(self._flush_later(key, group))
+        elif len(group) >= self.max_batch:
+            self._flush(key, group)
+        return await future
+
+    async def _flush_later(self, key, group):
+        await asyncio.sleep(self.window)
+        self._flush(key, group)
+
+    def _flush(self, key, group):
+        # a full group may already have been flushed before its timer fires
+        if self._pending.get(key) is not group:
+            return
+        del self._pending[key]
+        self._spawn(self._run(key, group))
+
+    async def _run(self, key, group):
+        self.stats["items"] += len(group)
+        self.stats["batches"] += 1
+        try:
+            results = await self.run_batch(key, [item for item, _ in group])
+        except Exception as e:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(group, results):
+            if not future.done():
+                future.set_result(result)
+
+
+async def _search(key, queries):
+    k, context, mode = key
+    return await executor.io.run("search", relevant_service.query_pdfs_batch, queries, k, context, mode)
+
+
+# single /relevant/search requests with the same k, context and mode share encoder passes
+search = MicroBatcher(_search)
@@ -0,0 +1,74 @@
+import os
+import hashlib
+import logging
+import tempfile
+from typing import BinaryIO
+
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from services import blob_store
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_BYTES", str(1 << 20)))
+MAX_UPLOAD_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(200 << 20)))
+# partial uploads live next to their destination so the final rename is atomic
+INCOMING_DIR = ".incoming"
+
+
+def _write_chunk(out: BinaryIO, hasher, chunk: bytes):
+    hasher.update(chunk)
+    out.write(chunk)
+
+
+def _finish(out: BinaryIO):
+    out.flush()
+    os.fsync(out.fileno())
+    out.close()
+
+
+async def save_upload(upload: UploadFile, dest_path: str, max_bytes: int = MAX_UPLOAD_BYTES) -> dict:
+    """
+    Stream an UploadFile to dest_path in CHUNK_SIZE pieces, hashing as it goes.
+
+    Bytes go to a temp file under <dest dir>/.incoming/ and only once complete
+    become dest_path, as a link into the content-addressed blob store, so readers
+    never see a partial PDF and identical files are stored once. Raises 413 past
+    max_bytes. Returns {"size", "sha256", "duplicate_of"}, where duplicate_of
+    lists the other filenames with the same content. The hash is also seeded into
+    result_cache so nothing re-reads the file just to key a cache.
+    """
+    incoming = os.path.join(os.path.dirname(dest_path), INCOMING_DIR)
+    os.makedirs(incoming, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=incoming, suffix=".part")
+    out = os.fdopen(fd, "wb")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes} byte upload limit")
+            await run_in_threadpool(_write_chunk, out, hasher, chunk)
+        await run_in_threadpool(_finish, out)
+        digest = hasher.hexdigest()
+        await run_in_threadpool(blob_store.store, tmp_path, digest, dest_path)
+    except BaseException:
+        out.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    name = os.path.basename(dest_path)
+    duplicates = [a for a in blob_store.aliases(os.path.dirname(dest_path), digest) if a != name]
+    logger.info(f"Stored upload {name} ({size} bytes, {len(duplicates)} other names for the same content)")
+    return {"size": size, "sha256": digest, "duplicate_of": duplicates}
+
+
+def list_uploads(folder: str):
+    """Completed uploads in folder; skips the .incoming and .blobs directories."""
+    return [f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f))]